@@ -0,0 +1,208 @@
+"""
+Headless load generator for Shmonikers.
+
+Spins up N games with M players each inside one process and drives the real flow
+through Flask's and Flask-SocketIO's test clients: /join, /api/hand submissions,
+start_round, bursts of get_card/skip_card, start_next_turn for every round, and
+finally lobby_return. Reports per-event latency (p50/p99), bytes emitted to clients
+and memory per game.
+
+    python bench/loadtest.py --games 50 --players 6
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flaskr import catalog, create_app, socketio  # noqa: E402
+from flaskr.broadcast import broadcaster  # noqa: E402
+from flaskr.events import events as event_log  # noqa: E402
+from flaskr.lifecycle import approx_game_bytes  # noqa: E402
+from flaskr.store import active_games  # noqa: E402
+
+TEAMS = ["Red", "Blue"]
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # event name -> seconds
+        self.bytes_out = 0
+        self.packets_out = 0
+
+    def timed(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        return result
+
+    def drain(self, clients):
+        '''Counts (and discards) everything the server pushed to these clients'''
+        # send what is still sitting in the emit buffers instead of waiting out the window
+        broadcaster.flush()
+        for client in clients:
+            for packet in client.get_received():
+                self.packets_out += 1
+                self.bytes_out += len(json.dumps([packet["name"]] + packet["args"], separators=(",", ":")))
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def ensure_catalog(min_cards):
+    '''The shipped cards.json is a one-card example, so fall back to a synthetic catalog'''
+    if len(catalog.get_catalog()) >= min_cards:
+        return
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump([{"term": f"Card {i}", "definition": f"Synthetic card number {i}", "points": 1 + i % 3}
+               for i in range(max(min_cards, 300))], tmp)
+    tmp.close()
+    catalog.CARDS_FILE = Path(tmp.name)
+    catalog._catalog = None
+
+class SimulatedGame:
+    def __init__(self, app, game_id, n_players, stats):
+        self.app = app
+        self.game_id = game_id
+        self.http = app.test_client()
+        self.stats = stats
+        self.names = []
+        self.sockets = []
+        for i in range(n_players):
+            resp = stats.timed("http:/join", self.http.post, "/join", data={
+                "player_name": f"p{i}", "game_id": game_id, "team_name": TEAMS[i % len(TEAMS)]})
+            # the final (possibly de-duplicated) name is in the redirect
+            self.names.append(parse_qs(urlparse(resp.headers["Location"]).query)["player_name"][0])
+
+    def submit_cards(self):
+        for name in self.names:
+            self.stats.timed("http:/draw", self.http.get, f"/draw?game_id={self.game_id}&player_name={name}")
+            url = f"/api/hand?game_id={self.game_id}&player_name={name}"
+            hand = self.stats.timed("http:/api/hand", self.http.get, url).get_json()["hand"]
+            picks = [card["id"] for card in hand[:6]]
+            self.stats.timed("http:/api/hand submit", self.http.post, url, json={"action": "submit", "cards": picks})
+
+    def connect(self):
+        for name in self.names:
+            client = socketio.test_client(self.app, flask_test_client=self.http)
+            self.stats.timed("join_game_room", client.emit, "join_game_room",
+                             {"game_id": self.game_id, "player_name": name})
+            self.sockets.append(client)
+
+    def emit(self, event, data):
+        data["game_id"] = self.game_id
+        self.stats.timed(event, self.sockets[0].emit, event, data)
+        self.stats.drain(self.sockets)
+
+    def play_round(self, guesses_per_turn, skip_rate):
+        '''Plays turns until the round's pool is empty. Returns False once the game is over'''
+        round_number = active_games[self.game_id].current_round
+        self.emit("start_round", {"player_name": self.names[0]})
+        while True:
+            game = active_games[self.game_id]
+            _, actor = game.current_actor()
+            for _ in range(guesses_per_turn):
+                card = game.active_pool.first()
+                if card is None:
+                    break
+                if random.random() < skip_rate:
+                    self.emit("skip_card", {"card_id": card.id})
+                else:
+                    self.emit("get_card", {"actor_name": actor, "card_id": card.id})
+                game = active_games[self.game_id]
+            if game.is_round_over():
+                # the round counter only moves on when there is another round to play
+                return game.current_round > round_number
+            self.emit("start_next_turn", {"turn_id": game.turn_id})
+
+    def leave(self):
+        # each player leaves from their own connection
+        for client in self.sockets:
+            self.stats.timed("lobby_return", client.emit, "lobby_return", {"game_id": self.game_id})
+            client.disconnect()
+        assert self.game_id not in active_games
+
+def run(args):
+    random.seed(args.seed)
+    ensure_catalog(12 * args.players)
+    app = create_app({"TESTING": True, "GAME_IDLE_TTL": 0, "SNAPSHOT_FILE": None, "CUSTOM_CARDS_FILE": None,
+                      "EVENT_LOG_FILE": args.record})
+    stats = Stats()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    games = [SimulatedGame(app, f"bench-{i}", args.players, stats) for i in range(args.games)]
+    for game in games:
+        game.submit_cards()
+    for game in games:
+        game.connect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    live_bytes = sum(approx_game_bytes(active_games[g.game_id]) for g in games)
+
+    started = time.perf_counter()
+    playing = list(games)
+    while playing:
+        # one round per game at a time, so every game stays resident while the others play
+        playing = [g for g in playing if g.play_round(args.guesses_per_turn, args.skip_rate)]
+    elapsed = time.perf_counter() - started
+    for game in games:
+        game.leave()
+    event_log.flush()
+
+    events = sum(len(v) for k, v in stats.latencies.items() if not k.startswith("http:"))
+    return {
+        "games": args.games,
+        "players_per_game": args.players,
+        "socket_events": events,
+        "events_per_second": events / elapsed if elapsed else 0,
+        "bytes_emitted": stats.bytes_out,
+        "packets_emitted": stats.packets_out,
+        "bytes_per_event": stats.bytes_out / events if events else 0,
+        "memory_per_game_traced": (after - before) / args.games,
+        "memory_per_game_estimated": live_bytes / args.games,
+        "latency_ms": {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50) * 1000,
+                "p99": percentile(values, 99) * 1000,
+            } for name, values in sorted(stats.latencies.items())
+        },
+    }
+
+def print_report(report):
+    print(f"{report['games']} games x {report['players_per_game']} players")
+    print(f"socket events:  {report['socket_events']} ({report['events_per_second']:.0f}/s)")
+    print(f"bytes emitted:  {report['bytes_emitted']} in {report['packets_emitted']} packets "
+          f"({report['bytes_per_event']:.0f} B/event)")
+    print(f"memory/game:    {report['memory_per_game_traced'] / 1024:.1f} KiB traced (incl. test client sessions), "
+          f"{report['memory_per_game_estimated'] / 1024:.1f} KiB estimated")
+    print(f"{'event':<22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, row in report["latency_ms"].items():
+        print(f"{name:<22}{row['count']:>8}{row['p50']:>10.3f}{row['p99']:>10.3f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--players", type=int, default=6, help="players per game")
+    parser.add_argument("--guesses-per-turn", type=int, default=8, help="get/skip burst length per turn")
+    parser.add_argument("--skip-rate", type=float, default=0.2, help="fraction of the burst that skips")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", metavar="PATH", help="write the games' event log here, for bench/replay.py")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
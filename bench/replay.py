@@ -0,0 +1,149 @@
+"""
+Replays recorded games against Game as fast as possible.
+
+Reads an event log written by the server (EVENT_LOG_FILE, rotated files included)
+or by `bench/loadtest.py --record`, and re-runs every complete game's state changes
+through the same Game calls the handlers make. Games are seeded, so deals and
+shuffles come out the same as in the recording; any guess that scores differently
+than it did live is counted as a divergence. Reports per-operation latency
+(p50/p99) and overall events per second.
+
+    python bench/replay.py game_events.jsonl --repeat 5
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flaskr import catalog  # noqa: E402
+from flaskr.events import read_events  # noqa: E402
+from flaskr.models import Deck, Game, Player  # noqa: E402
+from loadtest import ensure_catalog  # noqa: E402
+
+def _submit(game, t, args):
+    player = game.players[args["player"]]
+    ids = set(args["cards"])
+    cards = [card for card in player.hand if card.id in ids]
+    game.submit_cards(player, cards)
+    return len(cards) == len(ids)
+
+def _custom(game, t, args):
+    card = game.new_custom_card(args["term"], args["definition"], args["points"])
+    game.submit_cards(game.players[args["player"]], [card])
+
+def _start_round(game, t, args):
+    game.start_round()
+    game.deck = Deck()  # the start_round handler drops the deck too
+
+def _expire(game, t, args):
+    game.turn_time_left = 0
+    game.turn_ends_at = None
+
+def _next_round(game, t, args):
+    game.current_round += 1
+
+# op -> what the handler that recorded it did to the game. A False return is a divergence
+OPS = {
+    "join": lambda game, t, args: game.add_player(Player(args["player"], args["team"])),
+    "leave": lambda game, t, args: game.remove_player(args["player"]),
+    "deal": lambda game, t, args: game.deal([game.players[name] for name in args["players"]]),
+    "refresh": lambda game, t, args: game.refresh_hand_for_player(game.players[args["player"]]),
+    "submit": _submit,
+    "replace": lambda game, t, args: game.replace_in_hand(game.players[args["player"]], args["cards"]),
+    "custom": _custom,
+    "start_round": _start_round,
+    "begin_turn": lambda game, t, args: game.begin_turn(),
+    "start_clock": lambda game, t, args: game.start_clock(t),
+    "pause": lambda game, t, args: game.pause_clock(t),
+    "stop_clock": lambda game, t, args: game.stop_clock(t),
+    "expire": _expire,
+    "guess": lambda game, t, args: (game.guess_card(args["card"], args["team"]) is not None) == args["scored"],
+    "skip": lambda game, t, args: game.skip_card(args["card"]),
+    "next_turn": lambda game, t, args: game.next_turn(),
+    "next_round": _next_round,
+}
+
+def load_games(path):
+    '''Event lists per game, only for games whose creation is in the log'''
+    games = defaultdict(list)
+    for event in read_events(path):
+        t, game_id, op, args = event
+        if op == "create" or game_id in games:
+            games[game_id].append(event)
+    return games
+
+def replay(games, latencies):
+    '''Plays every game once. Returns (events replayed, divergences)'''
+    replayed = divergences = 0
+    for game_id, game_events in games.items():
+        game = None
+        for t, _, op, args in game_events:
+            start = time.perf_counter()
+            if op == "create":
+                game = Game(game_id, **args)  # seed and deck filters
+            elif OPS[op](game, t, args) is False:
+                divergences += 1
+            latencies[op].append(time.perf_counter() - start)
+            replayed += 1
+    return replayed, divergences
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run(args):
+    if args.cards:
+        catalog.CARDS_FILE = Path(args.cards)
+    else:
+        ensure_catalog(12)  # the same synthetic cards loadtest.py records with
+    games = load_games(args.log)
+    latencies = defaultdict(list)
+    replayed = divergences = 0
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        n, d = replay(games, latencies)
+        replayed += n
+        divergences += d
+    elapsed = time.perf_counter() - started
+    return {
+        "games": len(games),
+        "events": replayed,
+        "seconds": elapsed,
+        "events_per_second": replayed / elapsed if elapsed else 0,
+        "divergences": divergences,
+        "latency_us": {
+            op: {
+                "count": len(values),
+                "p50": percentile(values, 50) * 1e6,
+                "p99": percentile(values, 99) * 1e6,
+            } for op, values in sorted(latencies.items())
+        },
+    }
+
+def print_report(report):
+    print(f"{report['games']} games, {report['events']} events in {report['seconds']:.3f}s "
+          f"({report['events_per_second']:.0f}/s), {report['divergences']} divergences")
+    print(f"{'op':<14}{'count':>8}{'p50 us':>10}{'p99 us':>10}")
+    for op, row in report["latency_us"].items():
+        print(f"{op:<14}{row['count']:>8}{row['p50']:>10.1f}{row['p99']:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="event log (its rotated .1, .2, ... files are read too)")
+    parser.add_argument("--repeat", type=int, default=1, help="replay every game this many times")
+    parser.add_argument("--cards", help="cards.json the games were recorded with, if not the default (or loadtest's synthetic one)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,106 @@
-from flask import Flask
-from flask_socketio import SocketIO
+import os
 
-socketio = SocketIO()  # Not bound yet
+def __getattr__(name):
+    # flask and flask_socketio load on first use, so importing flaskr.startup
+    # first can time every import that follows
+    if name == "socketio":
+        from flaskr.extensions import socketio
+        return socketio
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def create_app(test_config=None):
+    from flask import Flask
+    from flaskr.extensions import socketio
 
-def create_app():
     app = Flask(__name__)
     app.secret_key = "dev"
 
+    # per-second update_timer ticks for clients that can't count down locally
+    app.config.setdefault("TIMER_TICK_COMPAT", False)
+    # "memory" (single process) or a redis:// URL shared by every worker
+    app.config.setdefault("GAME_STORE_URL", "memory")
+    # message queue (e.g. redis://) so emits reach clients connected to other workers
+    app.config.setdefault("SOCKETIO_MESSAGE_QUEUE", None)
+    # games untouched for this many seconds are evicted (0 disables), checked every GAME_REAP_INTERVAL
+    app.config.setdefault("GAME_IDLE_TTL", 2 * 60 * 60)
+    app.config.setdefault("GAME_REAP_INTERVAL", 60)
+    app.config.setdefault("LOG_FILE", "game_debug.log")
+    app.config.setdefault("LOG_LEVEL", "INFO")
+    # keep 1 in N records of high-frequency events (get_card, skip_card) at DEBUG
+    app.config.setdefault("LOG_SAMPLE_EVERY", 10)
+    # size 1 in N emitted payloads for shmonikers_emit_payload_bytes (1 measures every one)
+    app.config.setdefault("METRICS_PAYLOAD_SAMPLE_EVERY", 16)
+    # room-wide emits are buffered this long and sent as one "batch" event (0 sends each at once)
+    app.config.setdefault("EMIT_FLUSH_INTERVAL", 0.03)
+    # in-memory games are appended here every SNAPSHOT_INTERVAL seconds and restored on startup (None disables)
+    app.config.setdefault("SNAPSHOT_FILE", "game_snapshots.jsonl")
+    app.config.setdefault("SNAPSHOT_INTERVAL", 30)
+    # seconds a disconnected player has to come back before they count as gone (and their turn pauses)
+    app.config.setdefault("PRESENCE_GRACE", 10)
+    # directory for compiled templates, so later starts skip compiling them (None compiles every start)
+    app.config.setdefault("TEMPLATE_CACHE_DIR", None)
+    # every state change, for bench/replay.py (None disables); flushed in batches, rotated by size
+    app.config.setdefault("EVENT_LOG_FILE", "game_events.jsonl")
+    app.config.setdefault("EVENT_LOG_BUFFER", 256)
+    app.config.setdefault("EVENT_LOG_FLUSH_INTERVAL", 1)
+    app.config.setdefault("EVENT_LOG_MAX_BYTES", 64 * 1024 * 1024)
+    app.config.setdefault("EVENT_LOG_BACKUPS", 5)
+    # player-written cards join the catalog through this file, in batches (None keeps them in their game)
+    app.config.setdefault("CUSTOM_CARDS_FILE", "custom_cards.jsonl")
+    app.config.setdefault("CUSTOM_CARDS_BATCH", 50)
+    app.config.setdefault("CUSTOM_CARDS_FLUSH_INTERVAL", 60)
+    # cards from a game id's last N games are left out of its next deck (0 disables)
+    app.config.setdefault("RECENT_GAMES_EXCLUDED", 3)
+    # e.g. SHMONIKERS_GAME_STORE_URL=redis://localhost:6379/0
+    app.config.from_prefixed_env("SHMONIKERS")
+    if test_config:
+        app.config.update(test_config)
+
+    # logging runs on a background thread, see flaskr/logs.py
+    from flaskr.logs import configure_logging
+    configure_logging(app)
+
     # bind socketio to app
-    socketio.init_app(app)
+    socketio.init_app(app, message_queue=app.config["SOCKETIO_MESSAGE_QUEUE"])
+
+    from flaskr.store import active_games
+    active_games.init_app(app)
+
+    from flaskr.scheduler import turn_scheduler
+    turn_scheduler.init_app(app, socketio)
+
+    from flaskr.events import events
+    events.init_app(app)
+
+    from flaskr.catalog import custom_cards, recent_cards
+    custom_cards.init_app(app)
+    recent_cards.init_app(app)
+
+    from flaskr.presence import presence
+    from flaskr.broadcast import broadcaster
+    broadcaster.init_app(app, socketio, turn_scheduler, presence)
 
     # import routes AFTER socketio is created
-    from flaskr.routes import bp
+    from flaskr.routes import bp, drop_game, game_lock, player_gone, render_draw_shell, turn_timers, TIMER_LENGTH
     app.register_blueprint(bp)
+    # compile every template now rather than on the first request that needs it
+    if app.config["TEMPLATE_CACHE_DIR"]:
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(app.config["TEMPLATE_CACHE_DIR"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_DIR"])
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    render_draw_shell(app)
+    presence.init_app(app, turn_scheduler, on_gone=player_gone)
+
+    from flaskr.metrics import metrics
+    metrics.init_app(app, active_games, turn_timers)
+
+    # bring back games from before a restart, clocks paused
+    from flaskr.snapshots import game_snapshots
+    game_snapshots.init_app(app, socketio, active_games, lock_for=game_lock, tick_length=TIMER_LENGTH)
+
+    from flaskr.lifecycle import game_reaper
+    game_reaper.init_app(app, socketio, active_games, on_evict=drop_game, lock_for=game_lock)
 
     return app
\ No newline at end of file
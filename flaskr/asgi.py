@@ -0,0 +1,246 @@
+'''
+asyncio deployment: python-socketio's AsyncServer under an ASGI server, with the Flask
+routes mounted alongside it.
+
+    python -m flaskr.asgi --port 5000
+    uvicorn --factory flaskr.asgi:create_asgi_app
+
+Every connection and the scheduler's wait for the next deadline live on one event
+loop, so an idle connection costs a few objects on that loop rather than a thread.
+The handlers are the same synchronous functions as in threaded mode. They take game
+locks and touch the store, so they run on a thread pool (HANDLER_THREADS), as do the
+scheduler's callbacks (turn deadlines, emit flushes, presence grace periods). A slow
+handler holds up one pool thread, not the loop. Whatever they emit or join goes
+through AsyncBridge, which hands it to a single sender task on the loop, in order.
+HTTP routes run on their own small pool (WsgiMount) and go through the same bridge.
+The snapshot and reaper loops keep their own threads.
+
+Only the in-memory game store is supported in this mode (GAME_STORE_URL "memory").
+'''
+import argparse
+import asyncio
+import functools
+import io
+import logging
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# threads running Socket.IO handlers and scheduler callbacks
+HANDLER_THREADS = 16
+
+class AsyncBridge:
+    '''
+    Takes the place of flask_socketio's socketio.Server: the synchronous emit and room
+    calls the handlers make are queued and carried out, in order, by one task on the
+    AsyncServer's loop. Safe to call from the loop and from other threads.
+    '''
+    def __init__(self, server, app, executor):
+        self.server = server  # socketio.AsyncServer
+        self.app = app
+        self.executor = executor  # where handlers run, off the loop
+        self.eio = server.eio
+        self.async_mode = server.async_mode
+        self.loop = None
+        self._outbox = None
+
+    def start(self, loop):
+        self.loop = loop
+        self._outbox = asyncio.Queue()
+        loop.create_task(self._send_all())
+
+    def off_loop(self, handler):
+        '''Coroutine that runs a synchronous handler on the executor'''
+        @functools.wraps(handler)
+        async def run(*args):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(handler, *args))
+        return run
+
+    def _submit(self, fn, *args, **kwargs):
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._outbox.put_nowait((fn, args, kwargs))
+        else:
+            self.loop.call_soon_threadsafe(self._outbox.put_nowait, (fn, args, kwargs))
+
+    async def _send_all(self):
+        while True:
+            fn, args, kwargs = await self._outbox.get()
+            try:
+                await fn(*args, **kwargs)
+            except Exception:
+                logger.exception("socket.io %s failed", fn.__name__)
+
+    def emit(self, event, *args, namespace=None, to=None, skip_sid=None, callback=None, **kwargs):
+        # several arguments travel as a tuple, like in socketio.Server.emit
+        data = args[0] if len(args) == 1 else (args or None)
+        self._submit(self.server.emit, event, data, to=to, skip_sid=skip_sid, namespace=namespace,
+                     ignore_queue=kwargs.get("ignore_queue", False))
+
+    def enter_room(self, sid, room, namespace=None):
+        self._submit(self.server.enter_room, sid, room, namespace=namespace)
+
+    def leave_room(self, sid, room, namespace=None):
+        self._submit(self.server.leave_room, sid, room, namespace=namespace)
+
+    def close_room(self, room, namespace=None):
+        self._submit(self.server.close_room, room, namespace=namespace)
+
+    def disconnect(self, sid, namespace=None):
+        self._submit(self.server.disconnect, sid, namespace=namespace)
+
+    def rooms(self, sid, namespace=None):
+        return self.server.rooms(sid, namespace=namespace)
+
+    def get_environ(self, sid, namespace=None):
+        environ = self.server.get_environ(sid, namespace=namespace)
+        if environ is not None:
+            # flask_socketio's handler wrapper looks the app up here
+            environ.setdefault("flask.app", self.app)
+        return environ
+
+    # housekeeping loops (snapshots, reaper) stay on threads
+    @staticmethod
+    def start_background_task(target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def sleep(seconds=0):
+        time.sleep(seconds)
+
+class WsgiMount:
+    '''
+    Serves a WSGI app to an ASGI server from a thread pool. Requests and responses are
+    buffered whole, which is fine for this app's pages and small JSON bodies.
+    '''
+    def __init__(self, wsgi_app, threads=8):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        environ = self.environ(scope, bytes(body))
+        status, headers, chunks = await asyncio.get_running_loop().run_in_executor(self.executor, self._run, environ)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+    def _run(self, environ):
+        started = []
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(" ", 1)[0]),
+                          [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]]
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks = list(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started[0], started[1], chunks
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope["query_string"].decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = "HTTP_" + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+def create_asgi_app(test_config=None):
+    '''The Flask app and its Socket.IO handlers as one ASGI application'''
+    import socketio as python_socketio
+
+    from flaskr import create_app
+    from flaskr.extensions import socketio
+    from flaskr.scheduler import turn_scheduler
+
+    app = create_app(test_config)
+    if app.config["GAME_STORE_URL"] != "memory":
+        raise ValueError("The asyncio server only supports GAME_STORE_URL=memory")
+
+    url = app.config["SOCKETIO_MESSAGE_QUEUE"]
+    options = {}
+    if url:
+        if not url.startswith(("redis://", "rediss://")):
+            raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE for the asyncio server: {url}")
+        options["client_manager"] = python_socketio.AsyncRedisManager(url)
+    server = python_socketio.AsyncServer(async_mode="asgi", **options)
+    executor = ThreadPoolExecutor(HANDLER_THREADS, thread_name_prefix="handler")
+    bridge = AsyncBridge(server, app, executor)
+    # the handlers flask_socketio wrapped in create_app, each call on the pool
+    for event, handler in socketio.server.handlers.get("/", {}).items():
+        server.on(event, bridge.off_loop(handler))
+    socketio.server = bridge
+
+    asgi_app = python_socketio.ASGIApp(server, other_asgi_app=WsgiMount(app))
+
+    async def application(scope, receive, send):
+        if bridge.loop is None:
+            # first request of any kind, before anything can emit
+            loop = asyncio.get_running_loop()
+            bridge.start(loop)
+            turn_scheduler.use_loop(loop, executor)
+        await asgi_app(scope, receive, send)
+
+    application.flask_app = app
+    return application
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    # uvicorn shuts down, then re-raises the signal; exit normally so the shutdown snapshot still gets written
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    uvicorn.run(create_asgi_app(), host=args.host, port=args.port, lifespan="off")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from . import wire
+
+# state pushes where only the newest one matters; an unsent older one is dropped
+COALESCED_EVENTS = frozenset({"update_timer"})
+
+class RoomBroadcaster:
+    '''
+    Outbound buffer for room-wide emits. Events for a room are held for
+    EMIT_FLUSH_INTERVAL seconds and then sent together as one "batch" event
+    ([[event, data], ...]), so a guess that ends a turn and a round costs one frame
+    per client instead of three or four. Within a window only the latest
+    update_timer survives. An interval of 0 emits straight away.
+    '''
+    def __init__(self):
+        self.socketio = None
+        self.scheduler = None
+        self.interval = 0
+        self.presence = None
+        self._buffers = {}  # room -> [[event, data], ...]
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio, scheduler, presence=None):
+        self.socketio = socketio
+        self.scheduler = scheduler
+        self.interval = app.config["EMIT_FLUSH_INTERVAL"]
+        # with a message queue the room may have listeners on other workers, so always send
+        self.presence = None if app.config["SOCKETIO_MESSAGE_QUEUE"] else presence
+
+    def emit(self, event, data=None, room=None):
+        if self.presence is not None and not self.presence.count(room):
+            return  # nobody is connected to this game
+        if not self.interval:
+            self._send(room, [[event, data]])
+            return
+        with self._lock:
+            buffer = self._buffers.get(room)
+            if buffer is None:
+                buffer = self._buffers[room] = []
+                # first event of this window, flush when it closes
+                self.scheduler.call_at(time.time() + self.interval, self.flush, room)
+            elif event in COALESCED_EVENTS:
+                for i, (queued, _) in enumerate(buffer):
+                    if queued == event:
+                        del buffer[i]
+                        break
+            buffer.append([event, data])
+
+    def flush(self, room=None):
+        '''Sends what's buffered for one room, or for every room when room is None'''
+        with self._lock:
+            if room is None:
+                pending = list(self._buffers.items())
+                self._buffers.clear()
+            else:
+                pending = [(room, self._buffers.pop(room, None))]
+        for room, events in pending:
+            if events:
+                self._send(room, events)
+
+    def discard(self, room):
+        '''Drops whatever is still buffered for a room that is going away'''
+        with self._lock:
+            self._buffers.pop(room, None)
+
+    def _send(self, room, events):
+        if len(events) == 1:
+            event, data = events[0]
+            if data is None:
+                self.socketio.emit(event, room=room)
+            else:
+                self.socketio.emit(event, data, room=room)
+        else:
+            self.socketio.emit("batch", events, room=room)
+        if wire.msgpack is not None and (self.presence is None or self.presence.compact_count(room)):
+            # clients that negotiated msgpack listen on their own room, see flaskr/wire.py
+            self.socketio.emit("packed", wire.pack(events), room=wire.packed_room(room))
+
+broadcaster = RoomBroadcaster()
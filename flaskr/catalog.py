@@ -0,0 +1,278 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+CARDS_FILE = Path(__file__).parent / "data/cards.json"
+# player-written cards, appended by CustomCards and loaded after cards.json (None: not kept)
+CUSTOM_CARDS_FILE = None
+
+# how often (seconds) get_catalog() is allowed to stat cards.json for changes
+RELOAD_CHECK_INTERVAL = 5
+# earlier catalogs kept by fingerprint, for decoding games saved before a reload
+KNOWN_CATALOGS = 4
+
+class Card(NamedTuple):
+    '''One immutable card. Catalog cards are shared by every game, so never mutate them'''
+    id: int
+    term: str
+    definition: str
+    points: int
+    category: str = ""
+    author: str = ""  # player who wrote it, for cards that came from a game
+
+    def to_dict(self):
+        return {"id": self.id, "term": self.term, "definition": self.definition, "points": self.points}
+
+class Catalog:
+    '''
+    Read-only snapshot of cards.json plus the custom cards file. A card's id is its index
+    in the catalog. Ids are also indexed by (category, points) and by author when loaded,
+    so select() reads only the buckets a filter matches. The fingerprint is a hash of
+    the files it was loaded from; saved games record it, since their ids mean nothing
+    against any other catalog.
+    '''
+    def __init__(self, cards, mtime, fingerprint=""):
+        self.cards = tuple(cards)
+        self.mtime = mtime
+        self.fingerprint = fingerprint
+        self._buckets = {}    # (category, points) -> ids
+        self._by_author = {}  # author -> ids
+        self._terms = set()
+        for card in self.cards:
+            self._buckets.setdefault((card.category, card.points), array("i")).append(card.id)
+            if card.author:
+                self._by_author.setdefault(card.author, array("i")).append(card.id)
+            self._terms.add(card.term.casefold())
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __getitem__(self, card_id):
+        return self.cards[card_id]
+
+    def rows(self) -> list:
+        '''The cards as JSON-friendly lists, for saving a copy next to the games that use them'''
+        return [[c.term, c.definition, c.points, c.category, c.author] for c in self.cards]
+
+    @classmethod
+    def from_rows(cls, rows, fingerprint):
+        return cls((Card(i, *row) for i, row in enumerate(rows)), None, fingerprint)
+
+    def all_ids(self):
+        '''Compact int array of every card id, used as a new game's deck'''
+        return array("i", range(len(self.cards)))
+
+    def categories(self):
+        return sorted({category for category, _ in self._buckets if category})
+
+    def has_term(self, term) -> bool:
+        return term.casefold() in self._terms
+
+    def select(self, categories=None, points=None, authors=None, exclude=()):
+        '''
+        Ids of the cards matching every given filter (None matches anything) and not in
+        exclude, as a compact int array. Costs time in proportion to the cards that
+        match, not to the size of the catalog.
+        '''
+        if not (categories or points or authors or exclude):
+            return self.all_ids()
+        exclude = set(exclude)
+        ids = array("i")
+        if authors:
+            categories = set(categories) if categories else None
+            points = set(points) if points else None
+            for author in authors:
+                for card_id in self._by_author.get(author, ()):
+                    card = self.cards[card_id]
+                    if (categories is None or card.category in categories) and \
+                            (points is None or card.points in points) and card_id not in exclude:
+                        ids.append(card_id)
+            return ids
+        for (category, value), bucket in self._buckets.items():
+            if (categories and category not in categories) or (points and value not in points):
+                continue
+            if exclude:
+                ids.extend(card_id for card_id in bucket if card_id not in exclude)
+            else:
+                ids.extend(bucket)
+        return ids
+
+def _mtimes(path, custom_path):
+    custom = os.stat(custom_path).st_mtime if custom_path and os.path.exists(custom_path) else None
+    return os.stat(path).st_mtime, custom
+
+def _read_custom(data):
+    for line in data.splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue  # cut short by a crash
+
+def load_catalog(path=None, custom_path=None):
+    path = path or CARDS_FILE
+    custom_path = custom_path or CUSTOM_CARDS_FILE
+    mtime = _mtimes(path, custom_path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=12)
+    raw = json.loads(data)
+    if mtime[1] is not None:
+        with open(custom_path, "rb") as f:
+            data = f.read()
+        digest.update(data)
+        raw.extend(_read_custom(data))
+    cards = (Card(i, sys.intern(c["term"]), sys.intern(c["definition"]), int(c["points"]),
+                  sys.intern(c.get("category", "")), c.get("author", ""))
+             for i, c in enumerate(raw))
+    return Catalog(cards, mtime, digest.hexdigest())
+
+_catalog = None
+_checked_at = 0.0
+_lock = threading.Lock()
+_known = OrderedDict()  # fingerprint -> Catalog, oldest first
+
+def get_catalog() -> Catalog:
+    '''
+    Returns the shared catalog, loading it on first use. It is re-read only when cards.json
+    or the custom cards file changes, checked at most every RELOAD_CHECK_INTERVAL seconds.
+    Games keep a reference to the catalog they started with, so a reload never shifts ids
+    under a game in progress.
+    '''
+    global _catalog, _checked_at
+    now = time.monotonic()
+    if _catalog is not None and now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _catalog
+
+    with _lock:
+        if _catalog is None or now - _checked_at >= RELOAD_CHECK_INTERVAL:
+            try:
+                if _catalog is None or _mtimes(CARDS_FILE, CUSTOM_CARDS_FILE) != _catalog.mtime:
+                    _catalog = load_catalog()
+                    _remember(_catalog)
+            except (OSError, ValueError):
+                if _catalog is None:
+                    raise
+                # half-written or missing file, keep serving the last good copy
+            _checked_at = now
+    return _catalog
+
+def _remember(catalog):
+    _known.pop(catalog.fingerprint, None)
+    _known[catalog.fingerprint] = catalog
+    while len(_known) > KNOWN_CATALOGS:
+        _known.popitem(last=False)
+
+def remember_catalog(catalog):
+    '''Keeps a catalog findable by its fingerprint, e.g. one read back from a snapshot'''
+    with _lock:
+        _remember(catalog)
+
+def find_catalog(fingerprint):
+    '''The catalog with this fingerprint, or None if it is not loaded'''
+    current = get_catalog()
+    if fingerprint == current.fingerprint:
+        return current
+    return _known.get(fingerprint)
+
+class CustomCards:
+    '''
+    Adds player-written cards to the catalog. A writer thread appends them to
+    CUSTOM_CARDS_FILE in batches (every CUSTOM_CARDS_FLUSH_INTERVAL seconds, or once
+    CUSTOM_CARDS_BATCH are waiting) and games created after the next reload can draw
+    them. Terms the catalog already has are skipped.
+    '''
+    def __init__(self):
+        self.batch = 50
+        self.interval = 60
+        self._pending = {}  # casefolded term -> line
+        self._writer = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._at_exit = False
+
+    def init_app(self, app):
+        global CUSTOM_CARDS_FILE
+        self.flush()
+        CUSTOM_CARDS_FILE = app.config["CUSTOM_CARDS_FILE"]
+        self.batch = app.config["CUSTOM_CARDS_BATCH"]
+        self.interval = app.config["CUSTOM_CARDS_FLUSH_INTERVAL"]
+        if CUSTOM_CARDS_FILE and not self._at_exit:
+            atexit.register(self.flush)
+            self._at_exit = True
+
+    def add(self, card, author):
+        if not CUSTOM_CARDS_FILE or get_catalog().has_term(card.term):
+            return
+        line = json.dumps({"term": card.term, "definition": card.definition, "points": card.points,
+                           "category": "custom", "author": author}, separators=(",", ":"))
+        with self._lock:
+            self._pending[card.term.casefold()] = line
+            full = len(self._pending) >= self.batch
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="custom-cards", daemon=True)
+                self._writer.start()
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("writing custom cards failed")
+
+    def flush(self):
+        with self._lock:
+            lines = list(self._pending.values())
+            self._pending.clear()
+        if not lines or not CUSTOM_CARDS_FILE:
+            return
+        # one append per batch, so workers sharing the file never interleave inside a line
+        with open(CUSTOM_CARDS_FILE, "ab") as f:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+class RecentCards:
+    '''
+    Catalog cards that went into each group's last RECENT_GAMES_EXCLUDED games, so its
+    next deck can leave them out. A group is everyone who reuses a game id. At most
+    MAX_GROUPS groups are remembered, least recently played first out.
+    '''
+    MAX_GROUPS = 10_000
+
+    def __init__(self):
+        self.games = 0
+        self._groups = OrderedDict()  # game id -> [ids of each recent game]
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.games = app.config["RECENT_GAMES_EXCLUDED"]
+
+    def remember(self, group, card_ids):
+        if not self.games:
+            return
+        with self._lock:
+            recent = self._groups.pop(group, [])
+            recent.append(array("i", card_ids))
+            self._groups[group] = recent[-self.games:]
+            if len(self._groups) > self.MAX_GROUPS:
+                self._groups.popitem(last=False)
+
+    def used(self, group) -> list:
+        with self._lock:
+            return [card_id for ids in self._groups.get(group, ()) for card_id in ids]
+
+custom_cards = CustomCards()
+recent_cards = RecentCards()
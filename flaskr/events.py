@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class EventLog:
+    '''
+    Append-only record of every state-changing action, one compact JSON line per event:
+    [time, game_id, op, {args}]. Events are buffered and written in batches by a writer
+    thread (every EVENT_LOG_FLUSH_INTERVAL seconds, or as soon as EVENT_LOG_BUFFER events
+    are waiting), so a handler holding its game's lock never waits on the disk. The file
+    rotates like logging's RotatingFileHandler (events.jsonl, events.jsonl.1, ...) once
+    it passes EVENT_LOG_MAX_BYTES. bench/replay.py plays the games back against Game.
+    '''
+    def __init__(self):
+        self.path = None
+        self.buffer_size = 256
+        self.interval = 1
+        self.max_bytes = 0
+        self.backups = 5
+        self._buffer = []
+        self._writer = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._at_exit = False
+
+    def init_app(self, app):
+        self.flush()
+        self.path = app.config["EVENT_LOG_FILE"]
+        self.buffer_size = app.config["EVENT_LOG_BUFFER"]
+        self.interval = app.config["EVENT_LOG_FLUSH_INTERVAL"]
+        self.max_bytes = app.config["EVENT_LOG_MAX_BYTES"]
+        self.backups = app.config["EVENT_LOG_BACKUPS"]
+        if self.path and not self._at_exit:
+            atexit.register(self.flush)
+            self._at_exit = True
+
+    def record(self, game, op, **args):
+        '''Queues one event for a game'''
+        if not self.path:
+            return
+        line = json.dumps([round(time.time(), 3), game.session_id, op, args], separators=(",", ":"))
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.buffer_size
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._writer.start()
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("writing the event log failed")
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines or not self.path:
+            return
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._write_lock:
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+def read_events(path):
+    '''Every event in a log and its rotated files, oldest first'''
+    paths = [path]
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        paths.insert(0, f"{path}.{i}")
+        i += 1
+    for name in paths:
+        with open(name, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # cut short by a crash
+
+events = EventLog()
@@ -0,0 +1,3 @@
+from flask_socketio import SocketIO
+
+socketio = SocketIO()  # Not bound yet, see create_app
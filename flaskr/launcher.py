@@ -0,0 +1,278 @@
+'''
+Multi-worker launcher: runs several worker processes and a small front proxy that sends
+every request for a game to the worker that owns it, so each game's state stays in one
+process's memory while the lobbies spread over all cores.
+
+    python -m flaskr.launcher --workers 4 --port 5000
+
+Ownership is rendezvous hashing of the game id over the live workers. The proxy pins a
+game to its worker the first time it sees it. If a worker dies, it is taken out of the
+ring and restarted in the same slot, restoring its games from its own snapshot file.
+Requests for the games pinned to it wait for the restart (up to HOLD_REQUESTS seconds,
+then 503 with Retry-After) rather than reaching a worker that has never seen the game;
+only a worker still down after FAILOVER_AFTER seconds loses its games to the others.
+The game id is read from the query string (?game_id=, which the pages also pass to
+Socket.IO), from /game_over/<game_id>/... paths, or from the /join form; anything
+without one (lobby, static files) goes to any live worker.
+
+Per-worker endpoints (/metrics, /api/games/stats) describe only the worker that answers,
+so address them with ?worker=N (the slot, from 0) and scrape every slot, e.g.
+/metrics?worker=0 ... /metrics?worker=3. A slot out of range gets a 404.
+
+By default each worker is the threaded server on Werkzeug's development server, which
+is not a production-grade HTTP server. It only listens on 127.0.0.1 behind the proxy,
+but for production use --asgi: every worker then runs the asyncio server from
+flaskr/asgi.py on uvicorn.
+'''
+import argparse
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("flaskr.launcher")
+
+# how many game -> worker pins the proxy remembers
+MAX_PINS = 100_000
+# seconds a request for a game waits for its worker to come back before getting a 503
+HOLD_REQUESTS = 5
+# seconds a worker may stay down before its games are pinned to other workers (which start them empty)
+FAILOVER_AFTER = 30
+
+def rendezvous_owner(game_id, workers):
+    '''The worker with the highest hash(slot, game_id) owns the game'''
+    def weight(worker):
+        digest = hashlib.blake2b(f"{worker.slot}:{game_id}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+    return max(workers, key=weight)
+
+def game_id_of(method, target, body=b""):
+    '''Routing key of a request, or None'''
+    url = urlsplit(target)
+    game_id = parse_qs(url.query).get("game_id", [None])[0]
+    if game_id:
+        return game_id
+    if url.path.startswith("/game_over/"):
+        return url.path.split("/")[2]
+    if method == "POST" and body:
+        return parse_qs(body.decode("latin-1")).get("game_id", [None])[0]
+    return None
+
+def worker_slot_of(target, workers):
+    '''Slot a request addresses with ?worker=N, or None. ValueError if there's no such slot'''
+    slot = parse_qs(urlsplit(target).query).get("worker", [None])[0]
+    if slot is None:
+        return None
+    slot = int(slot)
+    if not 0 <= slot < workers:
+        raise ValueError(f"no worker {slot}")
+    return slot
+
+class Worker:
+    def __init__(self, slot, port, asgi=False):
+        self.slot = slot
+        self.port = port
+        self.asgi = asgi
+        self.proc = None
+        self.live = False
+        self.down_since = None  # monotonic time it stopped taking traffic
+
+    def up(self):
+        self.live = True
+        self.down_since = None
+
+    def down(self):
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+        self.live = False
+
+    def start(self):
+        env = dict(os.environ,
+                   SHMONIKERS_SNAPSHOT_FILE=f"game_snapshots.{self.slot}.jsonl",
+                   SHMONIKERS_LOG_FILE=f"game_debug.{self.slot}.log",
+                   SHMONIKERS_EVENT_LOG_FILE=f"game_events.{self.slot}.jsonl")
+        args = [sys.executable, "-m", "flaskr.launcher", "--serve-worker", str(self.port)]
+        if self.asgi:
+            args.append("--asgi")
+        self.proc = subprocess.Popen(args, env=env)
+
+class Launcher:
+    def __init__(self, workers, port, worker_port, asgi=False):
+        self.port = port
+        self.workers = [Worker(slot, worker_port + slot, asgi) for slot in range(workers)]
+        self.pins = OrderedDict()  # game id -> Worker
+        self._any = itertools.count()
+
+    def live_workers(self):
+        return [w for w in self.workers if w.live]
+
+    def route(self, game_id, slot=None):
+        '''
+        Worker for a request, or None if none can take it. A game stays with its pinned
+        worker while that restarts, and a slot is always that worker, so the result may
+        not be live yet.
+        '''
+        if slot is not None:
+            return self.workers[slot]
+        worker = self.pins.get(game_id) if game_id is not None else None
+        if worker is not None and not worker.live and worker.down_since is not None and \
+                time.monotonic() - worker.down_since >= FAILOVER_AFTER:
+            logger.warning("worker %d still down, moving game %s", worker.slot, game_id)
+            worker = None
+        live = self.live_workers()
+        if worker is None and not live:
+            return None
+        if game_id is None:
+            return live[next(self._any) % len(live)]
+        if worker is None:
+            worker = rendezvous_owner(game_id, live)
+            self.pins[game_id] = worker
+            if len(self.pins) > MAX_PINS:
+                self.pins.popitem(last=False)
+        else:
+            self.pins.move_to_end(game_id)
+        return worker
+
+    async def supervise(self, worker):
+        '''Keeps one worker slot running; it only takes traffic once it accepts connections'''
+        backoff = 0.5
+        while True:
+            worker.start()
+            while worker.proc.poll() is None:
+                if worker.live:
+                    await asyncio.sleep(0.5)
+                    continue
+                # starting up, or the proxy failed to connect to it: probe until it answers
+                try:
+                    _, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+                    writer.close()
+                    worker.up()
+                    backoff = 0.5
+                    logger.info("worker %d up on port %d", worker.slot, worker.port)
+                except OSError:
+                    await asyncio.sleep(0.1)
+            worker.down()
+            logger.warning("worker %d exited with %s, restarting", worker.slot, worker.proc.returncode)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = [line for line in lines[1:] if line]
+        names = {line.split(":", 1)[0].strip().lower(): line.split(":", 1)[1].strip() for line in headers}
+
+        body = b""
+        if method == "POST" and urlsplit(target).path == "/join":
+            # the game id of a new player is in the form, read it (it's small) to route on it
+            body = await reader.readexactly(int(names.get("content-length", 0)))
+
+        if "upgrade" not in names.get("connection", "").lower():
+            # one request per connection, so a reused browser connection can't reach the wrong worker
+            headers = [h for h in headers if h.split(":", 1)[0].strip().lower() not in ("connection", "keep-alive")]
+            headers.append("Connection: close")
+
+        try:
+            slot = worker_slot_of(target, len(self.workers))
+        except ValueError:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        game_id = game_id_of(method, target, body)
+        upstream_reader = upstream_writer = None
+        held_until = time.monotonic() + HOLD_REQUESTS
+        while upstream_writer is None:
+            worker = self.route(game_id, slot)
+            if worker is not None and not worker.live:
+                if time.monotonic() < held_until:
+                    await asyncio.sleep(0.1)  # the game is in that worker, wait for its restart
+                    continue
+                worker = None
+            if worker is None:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                             b"Retry-After: 1\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                writer.close()
+                return
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+            except OSError:
+                # died before the supervisor noticed; it brings it back
+                worker.down()
+        upstream_writer.write("\r\n".join([lines[0]] + headers).encode("latin-1") + b"\r\n\r\n" + body)
+        await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except RuntimeError:
+                pass  # event loop shutting down
+
+    async def run(self):
+        for worker in self.workers:
+            asyncio.ensure_future(self.supervise(worker))
+        server = await asyncio.start_server(self.handle, "0.0.0.0", self.port, limit=2 ** 16)
+        logger.info("proxy on port %d in front of %d workers", self.port, len(self.workers))
+        async with server:
+            await server.serve_forever()
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.proc and worker.proc.poll() is None:
+                worker.proc.terminate()
+
+def serve_worker(port, asgi=False):
+    if asgi:
+        from flaskr.asgi import main as serve_asgi
+        serve_asgi(["--host", "127.0.0.1", "--port", str(port)])
+        return
+    from flaskr import create_app, socketio
+    # exit normally on terminate, so the shutdown snapshot still gets written
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    app = create_app()
+    socketio.run(app, host="127.0.0.1", port=port, allow_unsafe_werkzeug=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--port", type=int, default=5000, help="public port of the proxy")
+    parser.add_argument("--worker-port", type=int, default=5100, help="first worker port, one per worker from here")
+    parser.add_argument("--asgi", action="store_true", help="run the workers on the asyncio server (needs uvicorn)")
+    parser.add_argument("--serve-worker", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_worker:
+        serve_worker(args.serve_worker, args.asgi)
+        return
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    launcher = Launcher(args.workers, args.port, args.worker_port, args.asgi)
+    try:
+        asyncio.run(launcher.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+
+if __name__ == "__main__":
+    main()
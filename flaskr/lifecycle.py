@@ -0,0 +1,106 @@
+import contextlib
+import logging
+import sys
+import time
+
+from .catalog import Card, Catalog
+from .models import CardPool, Deck, Game, Player, Team
+
+def approx_game_bytes(game: Game) -> int:
+    '''
+    Rough deep size of one game. Catalog cards are shared by every game, so only the
+    reference to them is counted, not the cards themselves.
+    '''
+    seen = set()
+    shared = len(game.catalog)
+
+    def size(obj):
+        if id(obj) in seen or isinstance(obj, Catalog):
+            return 0
+        if isinstance(obj, Card) and obj.id < shared:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, (Game, Player, Team, CardPool, Deck)):
+            total += size(obj.__dict__)
+        elif isinstance(obj, dict):
+            total += sum(size(k) + size(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set)):
+            total += sum(size(item) for item in obj)
+        # arrays (the deck) need no walking, getsizeof already counts their buffer
+        return total
+
+    return size(game)
+
+class GameReaper:
+    '''
+    Background task that evicts games nobody has touched for GAME_IDLE_TTL seconds
+    (closed tabs, groups that never returned to the lobby) and stops their turn clocks.
+    Each game is read under lock_for(game_id), like the handlers that change it.
+    '''
+    def __init__(self):
+        self.store = None
+        self.lock_for = None
+        self.on_evict = None
+        self.ttl = 0
+        self.interval = 60
+        self.evicted = 0
+
+    def init_app(self, app, socketio, store, on_evict=None, lock_for=None):
+        self.store = store
+        self.on_evict = on_evict
+        self.lock_for = lock_for
+        self.ttl = app.config["GAME_IDLE_TTL"]
+        self.interval = app.config["GAME_REAP_INTERVAL"]
+        if self.ttl:
+            socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception:
+                logging.exception("reaping idle games failed")
+
+    def _lock(self, game_id):
+        return self.lock_for(game_id) if self.lock_for else contextlib.nullcontext()
+
+    def reap(self, now=None) -> list:
+        '''Evicts every idle game. Returns the evicted game ids'''
+        now = now or time.time()
+        evicted = []
+        for game_id in self.store.ids():
+            with self._lock(game_id):
+                game = self.store.get(game_id)
+                if game is None or now - game.last_activity < self.ttl:
+                    continue
+                if self.on_evict:
+                    self.on_evict(game_id)
+                self.store.pop(game_id)
+            evicted.append(game_id)
+        self.evicted += len(evicted)
+        return evicted
+
+    def stats(self) -> dict:
+        '''Counts and approximate memory of the games currently held'''
+        games = players = approx_bytes = 0
+        oldest = None
+        for game_id in self.store.ids():
+            with self._lock(game_id):
+                game = self.store.get(game_id)
+                if game is None:
+                    continue
+                games += 1
+                players += len(game.players)
+                approx_bytes += approx_game_bytes(game)
+                oldest = game.last_activity if oldest is None else min(oldest, game.last_activity)
+        return {
+            "games": games,
+            "players": players,
+            "approx_bytes": approx_bytes,
+            "oldest_idle_seconds": time.time() - oldest if oldest is not None else 0,
+            "evicted_total": self.evicted
+        }
+
+game_reaper = GameReaper()
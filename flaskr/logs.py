@@ -0,0 +1,80 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+
+# every logger under "flaskr" (flaskr.models, flaskr.routes, ...) goes through here
+logger = logging.getLogger("flaskr")
+
+_listener = None
+
+class GameContextFilter(logging.Filter):
+    '''Fills in the game fields for records logged without a game, so the format never fails'''
+    def filter(self, record):
+        for field in ("game_id", "round", "turn"):
+            if not hasattr(record, field):
+                setattr(record, field, "-")
+        return True
+
+class SamplingFilter(logging.Filter):
+    '''Keeps 1 in `every` records marked with extra={"sampled": True}; everything else passes'''
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._count = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        return next(self._count) % self.every == 0
+
+class GameLogAdapter(logging.LoggerAdapter):
+    '''LoggerAdapter that keeps the caller's extra (e.g. sampled=True) next to the game fields'''
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+def for_game(game, name="flaskr"):
+    '''Logger that stamps every record with the game id, round and turn'''
+    return GameLogAdapter(logging.getLogger(name), {
+        "game_id": game.session_id,
+        "round": game.current_round,
+        "turn": game.current_turn_index,
+    })
+
+def configure_logging(app):
+    '''
+    Sends flaskr's log records through a queue to a background thread that does the
+    file I/O, so a slow disk never stalls a socket handler or timer callback.
+    LOG_FILE, LOG_LEVEL and LOG_SAMPLE_EVERY are read from the app config.
+    '''
+    global _listener
+    _stop_listener()
+
+    file_handler = logging.FileHandler(app.config["LOG_FILE"], encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s [%(game_id)s r%(round)s t%(turn)s] %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(app.config["LOG_SAMPLE_EVERY"]))
+    queue_handler.addFilter(GameContextFilter())
+
+    logger.handlers[:] = [queue_handler]
+    logger.setLevel(app.config["LOG_LEVEL"])
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+
+@atexit.register
+def _stop_listener():
+    '''Flushes whatever is still queued and closes the log file'''
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -0,0 +1,140 @@
+import functools
+import itertools
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+class Gauge:
+    '''Value read from a callback when /metrics is scraped, so it costs nothing on the hot path'''
+    def __init__(self, name, help, fn):
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn():g}"]
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.buckets, self.label_names = name, help, buckets, labels
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+class Metrics:
+    '''Process-wide counters for the game server, rendered in Prometheus text format'''
+    def __init__(self):
+        self.socket_events = Counter("shmonikers_socket_events_total", "Socket.IO events handled", ("event",))
+        self.socket_seconds = Histogram("shmonikers_socket_handler_seconds", "Socket.IO handler latency",
+                                        LATENCY_BUCKETS, ("event",))
+        self.http_requests = Counter("shmonikers_http_requests_total", "HTTP requests served", ("endpoint", "status"))
+        self.http_seconds = Histogram("shmonikers_http_request_seconds", "HTTP request latency",
+                                      LATENCY_BUCKETS, ("endpoint",))
+        self.payload_bytes = Histogram("shmonikers_emit_payload_bytes", "JSON size of a sample of emitted payloads",
+                                       SIZE_BUCKETS, ("event",))
+        self.payload_sample_every = 16
+        self._payloads = itertools.count()
+        self.connections = 0
+        self._base = [self.socket_events, self.socket_seconds, self.http_requests, self.http_seconds,
+                      self.payload_bytes]
+        self._metrics = list(self._base)
+
+    def init_app(self, app, store, turn_timers):
+        self.payload_sample_every = max(1, app.config["METRICS_PAYLOAD_SAMPLE_EVERY"])
+        self._metrics = self._base + [
+            Gauge("shmonikers_active_games", "Games currently held", lambda: len(store.ids())),
+            Gauge("shmonikers_turn_timers", "Running turns with a pending deadline or tick", lambda: len(turn_timers)),
+            Gauge("shmonikers_players_online", "Connected Socket.IO clients", lambda: self.connections),
+        ]
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule("/metrics", "metrics", self.render_view)
+
+    def instrumented(self, event):
+        '''Counts and times a Socket.IO handler'''
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    self.socket_events.inc(event)
+                    self.socket_seconds.observe(time.perf_counter() - start, event)
+            return wrapper
+        return decorator
+
+    def observe_payload(self, event, data):
+        '''Records the JSON size of 1 in payload_sample_every payloads, as sizing one costs an encode'''
+        if next(self._payloads) % self.payload_sample_every:
+            return
+        self.payload_bytes.observe(len(json.dumps(data, separators=(",", ":"))), event)
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+
+    def _end_request(self, response):
+        endpoint = request.endpoint or "unmatched"
+        start = g.get("metrics_start")
+        if endpoint != "metrics" and start is not None:
+            self.http_requests.inc(endpoint, response.status_code)
+            self.http_seconds.observe(time.perf_counter() - start, endpoint)
+        return response
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def render_view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+metrics = Metrics()
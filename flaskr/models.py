@@ -1,33 +1,84 @@
+import math
 import random
-import json
-from pathlib import Path
+import time
+from array import array
+from collections import OrderedDict
 
 from typing import List
 import logging
 
-logging.basicConfig(
-    filename='game_debug.log',  # file where logs go
-    level=logging.DEBUG,        # log all DEBUG+ messages
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+from .catalog import Card, find_catalog, get_catalog
+from .logs import for_game
 
-CARDS_FILE = Path(__file__).parent / "data/cards.json"
+# handlers and levels are set up in create_app (see flaskr.logs)
+logger = logging.getLogger(__name__)
 
 TURN_TIME = 63
+# below this many cards, a deck ignores the group's recent games rather than run short
+MIN_FRESH_DECK = 120
 
-def load_all_cards():
-    with open(CARDS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+class CardPool:
+    '''Ordered pool of cards keyed by card id.
+
+    Guessing a card, skipping it to the back and peeking at the front are all O(1),
+    so handlers never scan the pool or match on term strings.
+    '''
+    def __init__(self, cards=()):
+        self._cards = OrderedDict((card.id, card) for card in cards)
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __iter__(self):
+        return iter(self._cards.values())
+
+    def first(self):
+        return next(iter(self._cards.values()), None)
+
+    def remove(self, card_id):
+        '''Removes and returns the card, or None if it's not (or no longer) in the pool'''
+        return self._cards.pop(card_id, None)
+
+    def move_to_end(self, card_id) -> bool:
+        if card_id not in self._cards:
+            return False
+        self._cards.move_to_end(card_id)
+        return True
+
+    def to_list(self):
+        '''Cards as plain dicts, ready to be sent to clients'''
+        return [card.to_dict() for card in self._cards.values()]
+
+class Deck:
+    '''Draw pile of catalog card ids.
+
+    Nothing is shuffled up front: each draw swaps a randomly chosen id to the end of
+    the array and pops it, so drawing k cards costs O(k) however big the pile is,
+    and every remaining card is equally likely. Put back is an append.
+    '''
+    def __init__(self, card_ids=()):
+        self._cards = array("i", card_ids)
+
+    def __len__(self):
+        return len(self._cards)
+
+    def draw(self, n, rng=random):
+        cards = self._cards
+        if len(cards) < n:
+            raise ValueError("Not enough cards remaining to draw")
+        drawn = []
+        for _ in range(n):
+            j = rng.randrange(len(cards))
+            cards[j], cards[-1] = cards[-1], cards[j]
+            drawn.append(cards.pop())
+        return drawn
+
+    def ids(self):
+        return self._cards
+
+    def put_back(self, card_ids):
+        self._cards.extend(card_ids)
 
-class Card:
-    def __init__(self, term, definition, points):
-        self.term = term
-        self.definition = definition
-        self.points = points
-    
-    def __repr__(self):
-        return f"[\n\'Term\': {self.term} \n\'Definition\': {self.definition} \n\'Points\': {self.points}\n]"
-    
 class Player:
     def __init__(self, name, team=None):
         self.name = name
@@ -48,30 +99,78 @@ class Team:
         return f"[\n Name: {self.name}\n Members: {[p.name for p in self.members]}\n Score: {self.score}]"
 
 class Game:
-    def __init__(self, session_id):
+    def __init__(self, session_id, seed=None, categories=None, points=None, authors=None, exclude=()):
         self.session_id = session_id
+        # every random choice in the game comes from this seed, see rng()
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng_step = 0
         self.players: dict[str, Player] = {}
         self.teams: dict[str, Team] = {}
         self.game_pool: List[Card] = []  # final pool of cards for current game
-        self.active_pool: List[Card] = []  # what's changing during a round
-        self.remaining_cards = load_all_cards()
-        self.turn_order = []      # list of (team_name, actor_name)
+        self.active_pool = CardPool()  # what's changing during a round
+        # shared, read-only catalog; the deck only holds ids into it
+        self.catalog = get_catalog()
+        self.deck = self.build_deck(categories, points, authors, exclude)
+        # custom cards are numbered after the catalog so ids never collide
+        self.next_card_id = len(self.catalog)
         self.current_turn_index = 0
+        # cached turn rotation, see _rotation_teams()
+        self._rotation = None
+        self._teammates = {}
         self.turn_time_left = TURN_TIME  # seconds
         self.scores = {team: 0 for team in self.teams}
         self.total_rounds = 3
         self.current_round = 1
+        self.started_round = 0  # last round start_round() dealt, so it runs once per round
         self.paused = False
+        self.turn_ends_at = None  # wall-clock time the running turn's clock hits zero
+        self.turn_id = 0  # identifies the current turn so stale timers and clicks can be ignored
         self.cards_guessed = 0
+        self.state_seq = 0  # bumped on every change clients mirror (pool, scores, guessed count)
+        # kept up to date by submit_cards/remove_player instead of rescanning players per poll
+        self.submitted_names: List[str] = []
+        self.last_activity = time.time()  # used to evict abandoned games
+
+    def touch(self):
+        self.last_activity = time.time()
 
     def add_player(self, player):
         self.players[player.name] = player
         if player.team:
             self.add_team(player.team)
-            self.teams[player.team].members.append(player)
+            members = self.teams[player.team].members
+            members.append(player)
+            self._roster_changed(player.team, team_emptied_or_filled=len(members) == 1)
+
+    def remove_player(self, name):
+        player = self.players.pop(name, None)
+        if not player:
+            return None
+        if player.team in self.teams and player in self.teams[player.team].members:
+            members = self.teams[player.team].members
+            members.remove(player)
+            self._roster_changed(player.team, team_emptied_or_filled=not members)
+        if len(player.submitted) >= 6:
+            self.submitted_names.remove(self.submitted_label(player))
+        return player
+
+    def submit_cards(self, player, cards):
+        '''Adds cards to the player's submissions and the game pool'''
+        was_done = len(player.submitted) >= 6
+        player.submitted.extend(cards)
+        self.game_pool.extend(cards)
+        if not was_done and len(player.submitted) >= 6:
+            self.submitted_names.append(self.submitted_label(player))
+
+    @staticmethod
+    def submitted_label(player):
+        return player.name + " is on Team " + player.team
 
     def all_players_submitted(self) -> bool:
-        return self.game_pool and (len(self.game_pool) == 6 * len(self.players))
+        return bool(self.players) and len(self.submitted_names) == len(self.players)
+
+    def submission_status(self) -> dict:
+        return {"all_submitted": self.all_players_submitted(), "players": self.submitted_names}
 
     def add_team(self, team_name):
         if team_name not in self.teams:
@@ -82,49 +181,80 @@ class Game:
         key_to_move = list(d.keys())[0]
         val = d.pop(key_to_move)
         d[key_to_move] = val
+        rng = self.rng()
         for k in d:
-            random.shuffle(d[k].members)
+            rng.shuffle(d[k].members)
+        if d is self.teams:
+            self._rotation = None
+            self._teammates.clear()
+
+    def rng(self) -> random.Random:
+        '''
+        Generator for the next random operation. Seeded from the game seed and a step
+        counter, so a game's deals and shuffles replay exactly from its seed, and a
+        game reloaded from the store carries on where it left off.
+        '''
+        self.rng_step += 1
+        return random.Random(f"{self.seed}:{self.rng_step}")
+
+    def build_deck(self, categories=None, points=None, authors=None, exclude=()):
+        '''
+        Deck of the catalog cards matching the filters (see Catalog.select), leaving out
+        exclude unless that would make it too small. A filter that matches nothing gets
+        the whole catalog.
+        '''
+        ids = self.catalog.select(categories, points, authors, exclude)
+        if exclude and len(ids) < MIN_FRESH_DECK:
+            ids = self.catalog.select(categories, points, authors)
+        return Deck(ids if len(ids) else self.catalog.all_ids())
 
     def draw_cards_for_player(self, player, n=12):
-        if len(self.remaining_cards) < n:
-            raise ValueError("Not enough cards remaining to draw")
-        player.hand = random.sample(self.remaining_cards, n)
-        # Remove drawn cards from remaining deck
-        for card in player.hand:
-            self.remaining_cards.remove(card)
-    
+        player.hand = [self.catalog[card_id] for card_id in self.deck.draw(n, self.rng())]
+
+    def deal(self, players, n=12):
+        '''Deals n cards to each player in one draw from the deck'''
+        players = list(players)
+        drawn = self.deck.draw(n * len(players), self.rng())
+        for i, player in enumerate(players):
+            player.hand = [self.catalog[card_id] for card_id in drawn[i * n:(i + 1) * n]]
+
+    def replace_in_hand(self, player, card_ids):
+        '''Swaps the given cards out of a player's hand for fresh ones, the rest stay where they are'''
+        replace = set(card_ids)
+        fresh = iter(self.deck.draw(sum(1 for card in player.hand if card.id in replace), self.rng()))
+        player.hand = [self.catalog[next(fresh)] if card.id in replace else card for card in player.hand]
+
     def refresh_hand_for_player(self, player: Player):
-        # Return previous hand to the remaining deck
-        self.remaining_cards.extend(player.hand)
-        player.hand = []
-        self.draw_cards_for_player(player, n=12-len(player.submitted))
-
-    def setup_turn_order(self):
-        """Create a turn order that alternates between teams."""
-        # Make a copy of each team's members as queues
-        team_queues = {team_name: list(team.members) for team_name, team in self.teams.items() if team.members}
-        
-        self.turn_order = []
-
-        # Keep looping until all queues are empty
-        while any(team_queues.values()):
-            for team_name in self.teams:
-                if team_name in team_queues and team_queues[team_name]:
-                    # Pop the first player from the team's queue
-                    player = team_queues[team_name].pop(0)
-                    self.turn_order.append((team_name, player.name))
-        
-        self.current_turn_index = 0
+        n = 12 - len(player.submitted)
+        old = [card.id for card in player.hand]
+        if len(self.deck) >= n:
+            # draw before putting the old hand back, so a refresh never deals the same cards
+            self.draw_cards_for_player(player, n)
+            self.deck.put_back(old)
+        else:
+            self.deck.put_back(old)
+            self.draw_cards_for_player(player, n)
+
+    def new_custom_card(self, term, definition, points):
+        '''Creates a player-written card with its own id, even if the term is already taken'''
+        card = Card(self.next_card_id, term, definition, points)
+        self.next_card_id += 1
+        return card
 
     def start_round(self):
         """Initialize active_pool and turn order for a new round"""
-        self.active_pool = self.game_pool.copy()
-        random.shuffle(self.active_pool)
+        shuffled = self.game_pool.copy()
+        self.rng().shuffle(shuffled)
+        self.active_pool = CardPool(shuffled)
+        self.started_round = self.current_round
         self.reorder_teams(self.teams)
         # self.print_turn_order()
         self.current_turn_index = 0
         self.turn_time_left = TURN_TIME
         self.cards_guessed = 0
+        self.bump_state()
+        if logger.isEnabledFor(logging.DEBUG):
+            for_game(self, __name__).debug("round started with %d cards", len(self.active_pool))
     
     def next_turn(self):
         self.current_turn_index += 1
@@ -145,19 +275,201 @@ class Game:
     def print_turn_order(self):
         '''debugging method only'''
         for i in range(6):
-            team_queues = {j: team for j, team in enumerate(self.teams.values()) if team.members}
-            curr_team = team_queues[i % len(team_queues)]
-            team_name = curr_team.name
-            actor_name = curr_team.members[(i // len(team_queues)) % len(curr_team.members)].name
+            team_name, actor_name = self.actor_at(i)
             print(i, ": ", team_name, "; ", actor_name)
-    
+
+    def _rotation_teams(self):
+        '''
+        Teams that take turns, in order. Cached until a team gains its first member,
+        loses its last one, or the teams are reordered. Players joining or leaving a
+        team that stays non-empty don't invalidate it: actor_at() indexes the live
+        member list.
+        '''
+        if self._rotation is None:
+            self._rotation = [team for team in self.teams.values() if team.members]
+        return self._rotation
+
+    def _roster_changed(self, team_name, team_emptied_or_filled):
+        if team_emptied_or_filled:
+            self._rotation = None
+        self._teammates.pop(team_name, None)
+
+    def actor_at(self, turn_index):
+        '''(team_name, actor_name) for any turn: teams alternate, members cycle within a team'''
+        rotation = self._rotation_teams()
+        curr_team = rotation[turn_index % len(rotation)]
+        actor = curr_team.members[(turn_index // len(rotation)) % len(curr_team.members)]
+        return curr_team.name, actor.name
+
     def current_actor(self):
-        team_queues = {j: team for j, team in enumerate(self.teams.values()) if team.members}
-        curr_team = team_queues[self.current_turn_index % len(team_queues)]
-        team_name = curr_team.name
-        actor_name = curr_team.members[(self.current_turn_index // len(team_queues)) % len(curr_team.members)].name
-        return team_name, actor_name
+        return self.actor_at(self.current_turn_index)
+
+    def teammates(self, team_name, actor_name):
+        '''Everyone on the actor's team except the actor, i.e. this turn's guessers'''
+        by_actor = self._teammates.get(team_name)
+        if by_actor is None:
+            by_actor = self._teammates[team_name] = {}
+        guessers = by_actor.get(actor_name)
+        if guessers is None:
+            guessers = by_actor[actor_name] = [p.name for p in self.teams[team_name].members if p.name != actor_name]
+        return guessers
     
     def is_round_over(self):
         return len(self.active_pool) == 0
-    
\ No newline at end of file
+
+    def can_start_round(self) -> bool:
+        '''True once the current round number has not been started yet'''
+        return self.started_round != self.current_round
+
+    def begin_turn(self) -> int:
+        '''Starts a new turn: fresh guessed count and a new turn id'''
+        self.turn_id += 1
+        self.cards_guessed = 0
+        return self.turn_id
+
+    def turn_running(self) -> bool:
+        '''True while the clock is counting down (not paused, not expired)'''
+        return self.turn_ends_at is not None
+
+    def start_clock(self, now, tick_length=1):
+        '''Starts (or resumes) the turn clock from turn_time_left. Returns the deadline'''
+        self.paused = False
+        self.turn_ends_at = now + self.turn_time_left * tick_length
+        return self.turn_ends_at
+
+    def pause_clock(self, now, tick_length=1):
+        '''Freezes the clock, keeping whatever time was left for resume'''
+        self.turn_time_left = self.time_left(now, tick_length)
+        self.turn_ends_at = None
+        self.paused = True
+
+    def stop_clock(self, now, tick_length=1):
+        '''Ends the turn early, keeping the time that was left'''
+        self.turn_time_left = self.time_left(now, tick_length)
+        self.turn_ends_at = None
+
+    def time_left(self, now, tick_length=1) -> int:
+        '''Clock ticks left in the turn, rounded up like the client countdown shows it'''
+        if self.turn_ends_at is None:
+            return self.turn_time_left
+        return max(0, math.ceil((self.turn_ends_at - now) / tick_length))
+
+    def guess_card(self, card_id, team_name):
+        '''Scores a card for team_name. Returns the card, or None if it was already guessed'''
+        card = self.active_pool.remove(card_id)
+        if card:
+            self.cards_guessed += 1
+            self.teams[team_name].score += card.points
+        return card
+
+    def skip_card(self, card_id) -> bool:
+        '''Moves a card to the back of the pool'''
+        return self.active_pool.move_to_end(card_id)
+
+    def bump_state(self) -> int:
+        '''Advances the state sequence number. Every delta sent to clients carries one'''
+        self.state_seq += 1
+        return self.state_seq
+
+    def snapshot(self) -> dict:
+        '''Full copy of the client-visible round state, used for (re)syncing clients'''
+        return {
+            "seq": self.state_seq,
+            "game_pool": self.active_pool.to_list(),
+            "guessed_count": self.cards_guessed,
+            "scores": {t: self.teams[t].score for t in self.teams},
+            "round_number": self.current_round
+        }
+
+    def to_state(self) -> dict:
+        '''
+        Compact, JSON-friendly copy of the game for stores and snapshots. Catalog cards
+        are written as bare ids, next to the fingerprint of the catalog they index; only
+        custom cards carry their text.
+        '''
+        custom = {}
+        def ids(cards):
+            out = []
+            for card in cards:
+                # a reloaded catalog may have grown past a custom card's id, so check identity
+                if card.id >= len(self.catalog) or self.catalog[card.id] is not card:
+                    custom[card.id] = [card.term, card.definition, card.points]
+                out.append(card.id)
+            return out
+
+        return {
+            "id": self.session_id,
+            "catalog": self.catalog.fingerprint,
+            "players": [[p.name, p.team, ids(p.hand), ids(p.submitted)] for p in self.players.values()],
+            "teams": [[t.name, [p.name for p in t.members], t.score] for t in self.teams.values()],
+            "pool": ids(self.game_pool),
+            "active": ids(self.active_pool),
+            "deck": self.deck.ids().tolist(),
+            "seed": self.seed,
+            "rng_step": self.rng_step,
+            "custom": [[card_id] + fields for card_id, fields in custom.items()],
+            "next_card_id": self.next_card_id,
+            "turn": self.current_turn_index,
+            "time_left": self.turn_time_left,
+            "ends_at": self.turn_ends_at,
+            "turn_id": self.turn_id,
+            "paused": self.paused,
+            "round": self.current_round,
+            "started_round": self.started_round,
+            "total_rounds": self.total_rounds,
+            "guessed": self.cards_guessed,
+            "seq": self.state_seq,
+            "active_at": self.last_activity
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        '''
+        Rebuilds a game from to_state() output without reshuffling or reloading anything.
+        Raises LookupError if the catalog it was saved with is not loaded (see
+        catalog.remember_catalog)
+        '''
+        game = cls.__new__(cls)
+        game.session_id = state["id"]
+        game.catalog = find_catalog(state["catalog"])
+        if game.catalog is None:
+            raise LookupError(f"catalog {state['catalog']} of game {state['id']} is not loaded")
+        custom = {c[0]: Card(c[0], c[1], c[2], c[3]) for c in state["custom"]}
+        def cards(ids):
+            return [custom[i] if i in custom else game.catalog[i] for i in ids]
+
+        game.players = {}
+        for name, team, hand, submitted in state["players"]:
+            player = Player(name, team)
+            player.hand = cards(hand)
+            player.submitted = cards(submitted)
+            game.players[name] = player
+        game.teams = {}
+        for name, members, score in state["teams"]:
+            team = Team(name)
+            team.members = [game.players[m] for m in members if m in game.players]
+            team.score = score
+            game.teams[name] = team
+
+        game.game_pool = cards(state["pool"])
+        game.active_pool = CardPool(cards(state["active"]))
+        game.deck = Deck(state["deck"])
+        game.seed = state["seed"]
+        game.rng_step = state["rng_step"]
+        game.next_card_id = state["next_card_id"]
+        game._rotation = None
+        game._teammates = {}
+        game.current_turn_index = state["turn"]
+        game.turn_time_left = state["time_left"]
+        game.scores = {}
+        game.total_rounds = state["total_rounds"]
+        game.current_round = state["round"]
+        game.started_round = state["started_round"]
+        game.paused = state["paused"]
+        game.turn_ends_at = state["ends_at"]
+        game.turn_id = state["turn_id"]
+        game.cards_guessed = state["guessed"]
+        game.state_seq = state["seq"]
+        game.last_activity = state["active_at"]
+        game.submitted_names = [cls.submitted_label(p) for p in game.players.values() if len(p.submitted) >= 6]
+        return game
@@ -0,0 +1,86 @@
+import threading
+import time
+
+class Presence:
+    '''
+    Who is connected to which game, per Socket.IO session. A player whose last
+    connection drops gets PRESENCE_GRACE seconds to come back (a page load between
+    the waiting room and the round, a phone switching networks) before on_gone is
+    called. Counts are for this process only.
+    '''
+    def __init__(self):
+        self.scheduler = None
+        self.on_gone = None
+        self.grace = 10
+        self._sessions = {}  # sid -> (game_id, player_name or None)
+        self._rooms = {}     # game_id -> {sid: player_name or None}
+        self._compact = {}   # game_id -> sids using the compact wire encoding
+        self._away = {}      # (game_id, player_name) -> grace period call
+        self._lock = threading.Lock()
+
+    def init_app(self, app, scheduler, on_gone=None):
+        self.scheduler = scheduler
+        self.on_gone = on_gone
+        self.grace = app.config["PRESENCE_GRACE"]
+
+    def join(self, sid, game_id, player_name=None, compact=False) -> bool:
+        '''Puts a session in a game. Returns True if the player is coming back within the grace period'''
+        self.leave(sid, grace=False)
+        with self._lock:
+            self._sessions[sid] = (game_id, player_name)
+            self._rooms.setdefault(game_id, {})[sid] = player_name
+            if compact:
+                self._compact.setdefault(game_id, set()).add(sid)
+            pending = self._away.pop((game_id, player_name), None)
+        if pending:
+            pending.cancel()
+        return pending is not None
+
+    def leave(self, sid, grace=True):
+        '''Forgets a session. If it was its player's last one, starts the grace period'''
+        with self._lock:
+            game_id, player_name = self._sessions.pop(sid, (None, None))
+            room = self._rooms.get(game_id)
+            if room is None:
+                return
+            room.pop(sid, None)
+            if not room:
+                del self._rooms[game_id]
+            compact = self._compact.get(game_id)
+            if compact is not None:
+                compact.discard(sid)
+                if not compact:
+                    del self._compact[game_id]
+            still_here = player_name is None or player_name in room.values()
+            if grace and not still_here and (game_id, player_name) not in self._away:
+                self._away[(game_id, player_name)] = self.scheduler.call_at(
+                    time.time() + self.grace, self._gone, game_id, player_name)
+
+    def _gone(self, game_id, player_name):
+        with self._lock:
+            if self._away.pop((game_id, player_name), None) is None:
+                return  # came back just in time
+        if self.on_gone:
+            self.on_gone(game_id, player_name)
+
+    def session(self, sid):
+        '''(game_id, player_name) of a session, or (None, None)'''
+        return self._sessions.get(sid, (None, None))
+
+    def count(self, game_id) -> int:
+        '''Sessions connected to a game'''
+        return len(self._rooms.get(game_id, ()))
+
+    def compact_count(self, game_id) -> int:
+        '''Sessions connected to a game with the compact wire encoding (see flaskr/wire.py)'''
+        return len(self._compact.get(game_id, ()))
+
+    def forget_game(self, game_id):
+        '''Drops the grace periods of a game that is being removed'''
+        with self._lock:
+            away = [key for key in self._away if key[0] == game_id]
+            calls = [self._away.pop(key) for key in away]
+        for call in calls:
+            call.cancel()
+
+presence = Presence()
@@ -1,36 +1,130 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Blueprint, render_template, request, redirect, url_for
+from flask_socketio import emit, join_room
 from flask import current_app
-from .models import Game, Player
+from .models import Deck, Game, Player
 from flaskr import socketio
-
-import random
+from flaskr.scheduler import turn_scheduler
+# storage of active games (in memory unless GAME_STORE_URL says otherwise)
+from flaskr.store import active_games
+from flaskr.lifecycle import game_reaper
+from flaskr.metrics import metrics
+from flaskr.broadcast import broadcaster
+from flaskr import wire
+from flaskr.presence import presence
+from flaskr.events import events
+from flaskr.catalog import custom_cards, get_catalog, recent_cards
+from flaskr.logs import for_game
+
+import functools
+import hashlib
+import logging
+import contextlib
+import threading
 import time
 
 bp = Blueprint('routes', __name__, template_folder="templates")
-# in-memory storage of active games
-active_games = {}
-# storage of active turn flags. False = Running. True = Needs to stop.
-stop_turn_events = {}
+logger = logging.getLogger(__name__)
+# pending scheduler call (deadline or compat tick) of each game's running turn
+turn_timers = {}
+# one lock per game so its events are handled one at a time (within this process)
+game_locks = {}  # game id -> _GameLock, only changed under _game_locks_guard
+_game_locks_guard = threading.Lock()
 # debugging variable only. change to make timer during rounds speed up or slow down. Timer in seconds.
 TIMER_LENGTH = 1
 
+class _GameLock:
+    __slots__ = ("lock", "users", "is_game")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.users = 0        # threads holding or waiting for it
+        self.is_game = None   # whether the id is a live game, looked up once
+
+@contextlib.contextmanager
+def game_lock(game_id):
+    '''
+    Holds a game's lock. The entry of an id that isn't a game (or was dropped) is
+    removed once no thread holds or waits for it, so every thread still gets the
+    same lock and ids that never became a game don't pile up.
+    '''
+    with _game_locks_guard:
+        entry = game_locks.get(game_id)
+        if entry is None:
+            entry = game_locks[game_id] = _GameLock()
+        entry.users += 1
+    try:
+        with entry.lock:
+            try:
+                yield
+            finally:
+                if entry.is_game is None:
+                    entry.is_game = game_id in active_games
+    finally:
+        with _game_locks_guard:
+            entry.users -= 1
+            if not entry.users and not entry.is_game and game_locks.get(game_id) is entry:
+                del game_locks[game_id]
+
+def forget_game_lock(game_id):
+    '''Lets a dropped game's lock go, as soon as whoever holds it is done'''
+    with _game_locks_guard:
+        entry = game_locks.get(game_id)
+        if entry is not None:
+            entry.is_game = False
+            if not entry.users:
+                del game_locks[game_id]
+
+def per_game(handler):
+    '''
+    Runs a handler while holding its game's lock, so concurrent events for one game
+    (double-taps, two players clicking at once, the turn timer) can't interleave.
+    The game id comes from the socket payload, the request args/form for routes, or
+    the first argument itself for scheduler callbacks.
+    '''
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not args:
+            game_id = request.values.get("game_id")
+        elif isinstance(args[0], dict):
+            game_id = args[0].get("game_id")
+        else:
+            game_id = args[0]
+        with game_lock(game_id):
+            return handler(*args, **kwargs)
+    return wrapper
+
+def drop_game(game_id):
+    '''Releases the per-process resources of a game that is being removed'''
+    stop_turn_clock(game_id)
+    broadcaster.discard(game_id)
+    presence.forget_game(game_id)
+    forget_game_lock(game_id)
+
 @bp.route('/')
 def lobby():
     # lobby where players enter a game and pick a team
-    return render_template('lobby.html')
+    return render_template('lobby.html', categories=get_catalog().categories())
 
 @bp.route("/join", methods=["POST"])
+@per_game
 def join_game():
     player_name = request.form["player_name"]
     game_id = request.form["game_id"]
     team_name = request.form["team_name"]
 
     # Create a new game if it doesn't exist
-    if game_id not in active_games:
-        active_games[game_id] = Game(session_id=game_id)
-    
-    game:Game = active_games[game_id]
+    game: Game = active_games.get(game_id)
+    if not game:
+        # whoever creates the game picks its deck; cards this group just played sit out
+        deck = {
+            "categories": [c for c in request.form.getlist("category") if c],
+            "points": request.form.getlist("points", type=int),
+            "authors": [a for a in request.form.getlist("author") if a],
+            "exclude": recent_cards.used(game_id),
+        }
+        deck = {key: value for key, value in deck.items() if value}
+        game = Game(session_id=game_id, **deck)
+        events.record(game, "create", seed=game.seed, **deck)
 
     # check that name has not already been used. if so, just add a number at the end
     count = 2
@@ -41,85 +135,116 @@ def join_game():
     # Create player and assign to team
     player = Player(name=final_name, team=team_name)
     game.add_player(player)
+    events.record(game, "join", player=final_name, team=team_name)
+    active_games[game_id] = game
+    # a new player means not everyone has submitted any more
+    emit_submissions(game_id, game)
 
     # Redirect to draw cards page
     return redirect(url_for("routes.draw_cards", 
                             game_id=game_id, 
                             player_name=final_name))
 
-@bp.route("/draw", methods=["GET", "POST"])
+def hand_action(game_id, game, player, action, card_ids=(), term=None, definition=None, points=None):
+    '''
+    Applies one draw-phase action ("refresh", "submit" or "custom") to a player's hand.
+    Returns the message to show the player, or None.
+    '''
+    needed = 6 - len(player.submitted)
+    if action == "refresh":
+        game.refresh_hand_for_player(player)
+        events.record(game, "refresh", player=player.name)
+        active_games.save(game)
+        return None
+    if action == "custom":
+        if not term or not definition or needed <= 0:
+            return "A custom card needs a term and a definition."
+        custom_card = game.new_custom_card(term, definition, int(points or 1))
+        game.submit_cards(player, [custom_card])
+        custom_cards.add(custom_card, author=player.name)
+        events.record(game, "custom", player=player.name, term=term, definition=definition, points=custom_card.points)
+        message = "Custom card submitted!"
+    elif action == "submit":
+        selected_cards = set(card_ids)
+        if len(selected_cards) > needed:
+            return f"Please select up to {needed} cards to submit or press refresh to get new cards."
+        # Map selected ids to actual card objects
+        card_objects = [card for card in player.hand if card.id in selected_cards]
+        game.submit_cards(player, card_objects)
+        events.record(game, "submit", player=player.name, cards=[card.id for card in card_objects])
+        if len(player.submitted) < 6:
+            game.replace_in_hand(player, selected_cards)
+            events.record(game, "replace", player=player.name, cards=sorted(selected_cards))
+        message = "Cards submitted to game pool!"
+    else:
+        return None
+    active_games.save(game)
+    emit_submissions(game_id, game)
+    if len(player.submitted) < 6:
+        message += f" Please select {6-len(player.submitted)} more cards!"
+    return message
+
+def hand_response(game_id, player, message=None):
+    '''What the draw page needs after an action: the hand and where the player stands'''
+    done = len(player.submitted) >= 6
+    return {
+        "hand": [card.to_dict() for card in player.hand],
+        "needed": max(0, 6 - len(player.submitted)),
+        "message": message,
+        "next_url": url_for("routes.waiting_for_others", game_id=game_id, player_name=player.name) if done else None,
+    }
+
+# the draw page shell is the same for everyone: (html, etag), rendered by render_draw_shell()
+_draw_shell = None
+
+def render_draw_shell(app):
+    '''Renders the draw page shell and its ETag once, at startup'''
+    global _draw_shell
+    with app.test_request_context("/"):
+        html = render_template("draw_cards.html").encode("utf-8")
+    _draw_shell = (html, hashlib.sha1(html).hexdigest())
+
+@bp.route("/draw")
 def draw_cards():
+    '''Static page shell; the hand itself comes from /api/hand'''
+    html, etag = _draw_shell
+    response = current_app.response_class(html, mimetype="text/html")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # always revalidate, a 304 costs next to nothing
+    return response.make_conditional(request)
+
+@bp.route("/api/hand", methods=["GET", "POST"])
+@per_game
+def api_hand():
+    '''
+    JSON draw flow. GET deals the first hand if needed; POST takes {"action": "refresh"},
+    {"action": "submit", "cards": [ids]} or {"action": "custom", "term", "definition", "points"}.
+    Both answer with the player's hand only.
+    '''
     game_id = request.args.get("game_id")
-    player_name = request.args.get("player_name")
-
     game = active_games.get(game_id)
     if not game:
-        print(f"\n\n\tGAME NOT FOUND FOR {game_id}\n\n")
-        return "Game not found", 404
-
-    player = game.players.get(player_name)
+        logger.warning("draw: game %s not found", game_id)
+        return {"error": "not_found"}, 404
+    player = game.players.get(request.args.get("player_name"))
     if not player:
-        return "Player not found", 404
+        return {"error": "player_not_found"}, 404
 
-    # Handle refresh or submission
+    message = None
     if request.method == "POST":
-        if "refresh" in request.form:
-            game.refresh_hand_for_player(player)
-        elif "custom" in request.form:
-            term = request.form.get("term")
-            definition = request.form.get("definition")
-            points = int(request.form.get("points"))
-            custom_card = {
-                "term": term,
-                "definition": definition,
-                "points": points
-            }
-            player.submitted.append(custom_card)
-            game.game_pool.append(custom_card)
-            flash("Custom card submitted!")
-            if len(player.submitted) < 6:
-                flash(f"Please select {6-len(player.submitted)} more cards!")
-                return render_template("draw_cards.html",
-                        game_id=game_id,
-                        player_name=player_name,
-                        hand=player.hand)
-            else:
-                return redirect(url_for("routes.waiting_for_others",
-                                        game_id=game_id,
-                                        player_name=player_name))
-        elif "submit" in request.form:
-            selected_cards = request.form.getlist("card")
-            if len(selected_cards) > 6 - len(player.submitted):
-                flash(f"Please select up to {6-len(player.submitted)} cards to submit or press refresh to get new cards.")
-            else:
-                # Map selected terms to actual card objects
-                card_objects = [card for card in player.hand if card["term"] in selected_cards]
-                player.submitted.extend(card_objects)
-                game.game_pool.extend(card_objects)
-                flash("Cards submitted to game pool!")
-
-                if len(player.submitted) < 6:
-                    flash(f"Please select {6-len(player.submitted)} more cards!")
-                    left_over = [card for card in player.hand if card["term"] not in selected_cards]
-                    game.draw_cards_for_player(player, len(selected_cards))
-                    player.hand.extend(left_over)
-                    return render_template("draw_cards.html",
-                           game_id=game_id,
-                           player_name=player_name,
-                           hand=player.hand)
-                else:
-                    return redirect(url_for("routes.waiting_for_others",
-                                            game_id=game_id,
-                                            player_name=player_name))
-
-    # Initial draw if hand is empty
-    if not player.hand:
-        game.draw_cards_for_player(player)
-
-    return render_template("draw_cards.html",
-                           game_id=game_id,
-                           player_name=player_name,
-                           hand=player.hand)
+        data = request.get_json(silent=True) or {}
+        message = hand_action(game_id, game, player, data.get("action"),
+                              card_ids=[int(card_id) for card_id in data.get("cards", ())],
+                              term=data.get("term"),
+                              definition=data.get("definition"),
+                              points=data.get("points"))
+    elif not player.hand and len(player.submitted) < 6:
+        # Initial draw: the first player to get here deals everyone who still has no hand
+        dealt = [p for p in game.players.values() if not p.hand and len(p.submitted) < 6]
+        game.deal(dealt)
+        events.record(game, "deal", players=[p.name for p in dealt])
+        active_games.save(game)
+    return hand_response(game_id, player, message)
 
 @bp.route("/waiting_for_others")
 def waiting_for_others():
@@ -136,18 +261,39 @@ def waiting_for_others():
                            player_name=player_name)
 
 @bp.route("/api/check_submissions")
+@per_game
 def api_check_submissions():
     game_id = request.args.get("game_id")
     game = active_games.get(game_id)
 
     if not game:
         return {"error": "not_found"}, 404
-    
-    player_names = [p.name + " is on Team " + p.team for p in game.players.values() if len(p.submitted) == 6]
 
-    return {"all_submitted": game.all_players_submitted(), "players": player_names}
+    return game.submission_status()
+
+@bp.route("/api/games/stats")
+def api_game_stats():
+    '''How many games are live and roughly how much memory they hold'''
+    return game_reaper.stats()
+
+def emit_submissions(game_id, game):
+    '''Pushes who has submitted to the waiting room, replacing per-client polling'''
+    broadcaster.emit("submissions_updated", game.submission_status(), room=game_id)
+
+@bp.route("/api/game_state")
+@per_game
+def api_game_state():
+    '''Full round state for clients that missed a delta and need to resync'''
+    game_id = request.args.get("game_id")
+    game = active_games.get(game_id)
+
+    if not game:
+        return {"error": "not_found"}, 404
+
+    return game.snapshot()
 
 @bp.route("/start_round")
+@per_game
 def start_round_page():
     '''What happens during the redirect from waiting_for_others'''
     game_id = request.args.get("game_id")
@@ -159,9 +305,10 @@ def start_round_page():
 
     first_team_name, actor_name = game.current_actor()
     # every teammate of the actor who's going to be guessing next
-    actor_teammates = [p.name for p in game.teams[first_team_name].members if p.name != actor_name]
+    actor_teammates = game.teammates(first_team_name, actor_name)
     # map each player to their team name to display in front end separate from acting team name
     player_map = {p.name: p.team for p in game.players.values()}
+    first_card = game.active_pool.first()
 
     return render_template("round.html",
                            game_id=game_id,
@@ -171,33 +318,42 @@ def start_round_page():
                            player_map=player_map,
                            guesser_names=actor_teammates,
                            round_number=game.current_round,
-                           game_pool=game.active_pool,
-                           first_term=game.active_pool[0]["term"],
-                           first_def=game.active_pool[0]["definition"],
-                           first_points=game.active_pool[0]["points"],
-                           time=game.turn_time_left)
+                           first_term=first_card.term if first_card else "",
+                           first_def=first_card.definition if first_card else "",
+                           first_points=first_card.points if first_card else "",
+                           time=game.time_left(time.time(), TIMER_LENGTH),
+                           turn_ends_at=game.turn_ends_at,
+                           server_time=time.time(),
+                           tick_length=TIMER_LENGTH,
+                           paused=game.paused,
+                           turn_id=game.turn_id)
 
 @socketio.on("start_round")
+@metrics.instrumented("start_round")
+@per_game
 def socket_start_round(data):
     '''Starts a round during the game'''
     game_id = data.get("game_id")
     game = active_games.get(game_id)
     if not game:
         return
+    if not game.can_start_round():
+        return  # someone else already started it (or the game is over)
     
     player_name = data.get("player_name")
 
+    if game.current_round == 1:
+        recent_cards.remember(game_id, [card.id for card in game.game_pool if card.id < len(game.catalog)])
     game.start_round()
     # save up memory
-    game.remaining_cards = []
+    game.deck = Deck()
+    events.record(game, "start_round")
+    active_games.save(game)
 
     first_team_name, actor_name = game.current_actor()
-    print(f"\n\n\n\t[DEBUG] Starting round for game {game_id}, current_actor={first_team_name+"; "+actor_name}\n\n\n")
+    for_game(game, __name__).info("starting round, current actor %s; %s", first_team_name, actor_name)
 
-    # Start turn loop as background task
-    socketio.start_background_task(start_turn, game_id)
-
-    socketio.emit("round_started", {
+    broadcaster.emit("round_started", {
         "round_number": game.current_round,
         "active_pool_length": len(game.active_pool),
         "team_name": first_team_name,
@@ -205,188 +361,345 @@ def socket_start_round(data):
         "player_name": player_name,
     }, room=game_id)
 
+    start_turn(game_id)
+
+@socketio.on("connect")
+def handle_connect(auth=None):
+    metrics.connections += 1
+    # opt-in compact encoding, old clients don't send auth and keep JSON
+    wire.negotiate(request.sid, auth)
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    metrics.connections -= 1
+    wire.forget(request.sid)
+    # starts the player's grace period if this was their last tab
+    presence.leave(request.sid)
+
 @socketio.on("join_game_room")
+@metrics.instrumented("join_game_room")
+@per_game
 def handle_join(data):
     game_id = data["game_id"]
-    join_room(game_id)
+    player_name = data.get("player_name")
+    back = presence.join(request.sid, game_id, player_name, compact=wire.is_compact(request.sid))
+    join_room(wire.room_for(game_id, request.sid))
     # emit("player_joined", {"player_name": data["player_name"]}, room=game_id)
+    game = active_games.get(game_id)
+    if back and game:
+        # whatever was broadcast while the player was away
+        send_snapshot(game)
+        if game.turn_running() or game.paused:
+            emit("update_pause", {
+                "paused": game.paused,
+                "time_left": game.time_left(time.time(), TIMER_LENGTH),
+                "ends_at": game.turn_ends_at,
+                "server_time": time.time()
+            })
+
+@socketio.on("request_state")
+@metrics.instrumented("request_state")
+@per_game
+def handle_request_state(data):
+    '''Sends a full snapshot to a single client that detected a gap in the delta sequence'''
+    game = active_games.get(data["game_id"])
+    if not game:
+        return
+    send_snapshot(game)
+
+def send_snapshot(game):
+    '''Sends the full round state to the client whose event is being handled'''
+    snapshot = game.snapshot()
+    metrics.observe_payload("update_game_state", snapshot)
+    if wire.is_compact(request.sid):
+        emit("packed", wire.pack([["update_game_state", snapshot]]))
+    else:
+        emit("update_game_state", snapshot)
+
+@per_game
+def player_gone(game_id, player_name):
+    '''Runs when a player's grace period ends without them reconnecting'''
+    game = active_games.get(game_id)
+    if not game or not game.turn_running():
+        return
+    if game.current_actor()[1] != player_name:
+        return
+    # nobody can act out the cards, hold the clock until they're back and someone resumes
+    stop_turn_clock(game_id)
+    game.pause_clock(time.time(), TIMER_LENGTH)
+    events.record(game, "pause")
+    active_games.save(game)
+    for_game(game, __name__).info("actor %s disconnected, turn paused", player_name)
+    broadcaster.emit("update_pause", {
+        "paused": True,
+        "time_left": game.turn_time_left
+    }, room=game_id)
+
+def emit_state_delta(game_id, game, op, **fields):
+    '''Broadcasts one small, sequenced change to the round state instead of the whole pool'''
+    delta = {"seq": game.bump_state(), "op": op}
+    delta.update(fields)
+    metrics.observe_payload("game_state_delta", delta)
+    broadcaster.emit("game_state_delta", delta, room=game_id)
 
 @socketio.on("get_card")
+@metrics.instrumented("get_card")
+@per_game
 def handle_get_card(data):
     game_id = data["game_id"]
     actor_name = data["actor_name"]
-    card_term = data["card_term"]
+    card_id = data["card_id"]
 
     game = active_games.get(game_id)
-    if not game:
-        return
-
-    card = next((c for c in game.active_pool if c["term"] == card_term), None)
+    if not game or not game.turn_running():
+        return  # no guessing while paused or after the clock ran out
+
+    team_name = game.players[actor_name].team
+    # a double-tap finds the card already gone and scores nothing
+    card = game.guess_card(card_id, team_name)
+    events.record(game, "guess", card=card_id, team=team_name, scored=card is not None)
+    if logger.isEnabledFor(logging.DEBUG):
+        for_game(game, __name__).debug("get_card %s by %s: %s", card_id, actor_name,
+                                       "scored" if card else "ignored", extra={"sampled": True})
     if card:
-        game.active_pool.remove(card)
-        game.cards_guessed += 1
-        team_name = game.players[actor_name].team
-        game.teams[team_name].score += card["points"]
-
-    if game.is_round_over():
+        emit_state_delta(game_id, game, "guessed",
+                         card_id=card_id,
+                         guessed_count=game.cards_guessed,
+                         team_name=team_name,
+                         score=game.teams[team_name].score)
+
+    if card and game.is_round_over():
+        # last card is gone, the turn ends early
+        stop_turn_clock(game_id)
+        game.stop_clock(time.time(), TIMER_LENGTH)
+        events.record(game, "stop_clock")
         scores_string = ""
         for team, score in {t: game.teams[t].score for t in game.teams}.items():
             scores_string += "The " + team + " have " + str(score) + " points! "
-        socketio.emit("turn_ended", {
+        broadcaster.emit("turn_ended", {
             "actor_name": actor_name,
             "team_name": team_name,
             "time_left": game.turn_time_left
         }, room=game_id)
         if game.current_round < game.total_rounds:
-            socketio.emit("round_over", {"scores": scores_string}, room=game_id)
-    
-    socketio.emit("update_game_state", {
-        "game_pool": game.active_pool,
-        "guessed_count": game.cards_guessed
-    }, room=game_id)
+            broadcaster.emit("round_over", {"scores": scores_string}, room=game_id)
+        finish_round(game_id, game)
+    active_games.save(game)
     
 @socketio.on("skip_card")
+@metrics.instrumented("skip_card")
+@per_game
 def handle_skip_card(data):
     '''For when a team can't get a card and skips it'''
     game_id = data["game_id"]
-    card_term = data["card_term"]
+    card_id = data["card_id"]
 
     game = active_games.get(game_id)
-    if not game:
+    if not game or not game.turn_running():
         return
 
     # Move card to end of the pool
-    card = next((c for c in game.active_pool if c["term"] == card_term), None)
-    if card:
-        game.active_pool.remove(card)
-        game.active_pool.append(card)
-
-    # Broadcast updated pool
-    emit("update_game_state", {"game_pool": game.active_pool, "guessed_count": game.cards_guessed}, room=game_id)
+    if logger.isEnabledFor(logging.DEBUG):
+        for_game(game, __name__).debug("skip_card %s", card_id, extra={"sampled": True})
+    if game.skip_card(card_id):
+        events.record(game, "skip", card=card_id)
+        # Broadcast just the move, clients replay it on their copy of the pool
+        emit_state_delta(game_id, game, "skipped", card_id=card_id)
+        active_games.save(game)
 
 @socketio.on("start_next_turn")
+@metrics.instrumented("start_next_turn")
+@per_game
 def handle_start_next_turn(data):
     '''Function that starts the next turn mid-round, not at the start of a round'''
     game_id = data["game_id"]
     game = active_games.get(game_id)
     if not game:
         return
+    # clients say which turn they saw end; a second click for the same turn is a no-op
+    if data.get("turn_id", game.turn_id) != game.turn_id:
+        return
+    # the last card ended the round: the next one starts through start_round, not here
+    if game.is_round_over():
+        return
     
-    # check if there is an active turn in this game
-    if game_id in stop_turn_events:
-        stop_turn_events[game_id] = True
-        socketio.sleep(.9)
+    # cancel the running turn's deadline, if any. The turn id change makes
+    # a callback that's already on its way a no-op, so there's nothing to wait for
+    stop_turn_clock(game_id)
 
-    game.next_turn()
-    game.paused = False
-    socketio.start_background_task(start_turn, game_id)
+    actor = game.next_turn()
+    events.record(game, "next_turn")
+    active_games.save(game)
+    if actor is not None:
+        start_turn(game_id)
 
 def start_turn(game_id):
     """
-    Background task that runs the full round: iterates turns until active_pool is empty
-    (round over). Emits socket events for clients to update UI.
+    Starts the current actor's turn: resets the guessed count, announces the turn with
+    its absolute end time, and hands the deadline to the shared turn scheduler. Clients
+    count down locally; the server only speaks again on pause/resume/expiry.
     """
     game = active_games.get(game_id)
     if not game:
         return
-    
-    # set new flag saying the turn should not be stopped
-    stop_turn_events[game_id] = False
 
-    # reset guessed count
-    game.cards_guessed = 0
-    
-    socketio.emit("update_game_state", {
-        "game_pool": game.active_pool,
-        "guessed_count": game.cards_guessed
-    }, room=game_id)
+    # new turn id and reset guessed count
+    turn_id = game.begin_turn()
+    events.record(game, "begin_turn")
+    emit_state_delta(game_id, game, "turn_reset", guessed_count=game.cards_guessed)
 
     # Get current actor/team for this turn while starting the next turn
     team_name, actor_name = game.current_actor()
     # every teammate of the actor who's going to be guessing next
-    actor_teammates = [p.name for p in game.teams[team_name].members if p.name != actor_name]
+    actor_teammates = game.teammates(team_name, actor_name)
+
+    now = time.time()
+    ends_at = game.start_clock(now, TIMER_LENGTH)
+    events.record(game, "start_clock")
+    active_games.save(game)
 
     # Announce the turn started
-    socketio.emit("turn_started", {
+    broadcaster.emit("turn_started", {
         "team_name": team_name,
         "actor_name": actor_name,
         "time_limit": game.turn_time_left,
-        "guesser_names": actor_teammates
+        "guesser_names": actor_teammates,
+        "ends_at": ends_at,
+        "server_time": now,
+        "tick_length": TIMER_LENGTH,
+        "turn_id": turn_id
     }, room=game_id)
 
-    # Initialize timer
-    socketio.emit("update_timer", {
-        "time_left": game.turn_time_left,
-        "actor_name": actor_name,
-        "team_name": team_name
-    }, room=game_id)
+    schedule_turn_clock(game_id, game, compat_ticks=current_app.config["TIMER_TICK_COMPAT"])
 
-    # Per-second timer loop for this turn
-    while game.turn_time_left > 0 and not game.is_round_over():
-        # check if game is paused. If so, do not update timer.
-        if game.paused:
-            socketio.sleep(0.3)
-            continue
+def schedule_turn_clock(game_id, game, compat_ticks=False):
+    '''Registers the running turn's next wake-up with the shared scheduler'''
+    if compat_ticks:
+        # old clients need an update_timer every tick, so wake up once per tick
+        turn_timers[game_id] = turn_scheduler.call_at(time.time() + TIMER_LENGTH, tick_turn, game_id, game.turn_id)
+    else:
+        turn_timers[game_id] = turn_scheduler.call_at(game.turn_ends_at, expire_turn, game_id, game.turn_id)
 
-        socketio.emit("update_timer", {
-            "time_left": game.turn_time_left,
-            "actor_name": actor_name,
-            "team_name": team_name
-        }, room=game_id)
+def stop_turn_clock(game_id):
+    timer = turn_timers.pop(game_id, None)
+    if timer:
+        timer.cancel()
 
-        game.turn_time_left -= 1
-
-        socketio.sleep(TIMER_LENGTH)
-
-    socketio.emit("turn_ended", room=game_id)
-    # If the round ended while this turn was running, handle round end
-    if game.is_round_over():
-        # If you want to automatically start next round (if any), do it here:
-        if game.current_round < game.total_rounds:
-            # increment round and initialize active_pool for next round
-            game.current_round = getattr(game, "current_round", 1) + 1
-            socketio.emit("round_ready", {
-                "round_number": game.current_round,
-            }, room=game_id)
-        else:
-            # Game completely finished
-            scores = {t: game.teams[t].score for t in game.teams}
-            scores = sorted(scores.items(), key=lambda item: item[1], reverse=True)
-            # for debugging only
-            if len(scores) == 1:
-                scores.append(["Testing Team", 12])
-            socketio.emit("game_over", {
-                        "redirect_url": f"/game_over/{game_id}/{scores[0][0]}/{scores[0][1]}/{scores[1][0]}/{scores[1][1]}"
-                    }, room=game_id)
-
-    # background task exits cleanly here
-    return
+@per_game
+def tick_turn(game_id, turn_id):
+    '''Compatibility mode: emits update_timer once per tick until the turn runs out'''
+    game = active_games.get(game_id)
+    if not game or game.turn_id != turn_id or not game.turn_running():
+        return  # stale tick from a turn that was stopped while this was waiting
+    time_left = game.time_left(time.time(), TIMER_LENGTH)
+    team_name, actor_name = game.current_actor()
+    timer = {
+        "time_left": time_left,
+        "actor_name": actor_name,
+        "team_name": team_name
+    }
+    metrics.observe_payload("update_timer", timer)
+    broadcaster.emit("update_timer", timer, room=game_id)
+    if time_left > 0:
+        schedule_turn_clock(game_id, game, compat_ticks=True)
+    else:
+        expire_turn(game_id, turn_id)
+
+@per_game
+def expire_turn(game_id, turn_id):
+    '''Runs on the scheduler task when a turn's deadline passes'''
+    game = active_games.get(game_id)
+    if not game or game.turn_id != turn_id or not game.turn_running():
+        return  # stale deadline from a turn that was stopped while this was waiting
+    turn_timers.pop(game_id, None)
+    game.turn_time_left = 0
+    game.turn_ends_at = None
+    events.record(game, "expire")
+    active_games.save(game)
+
+    broadcaster.emit("turn_ended", room=game_id)
+
+def finish_round(game_id, game):
+    '''Announces the next round, or the final scores if that was the last one'''
+    if game.current_round < game.total_rounds:
+        # increment round and initialize active_pool for next round
+        game.current_round = getattr(game, "current_round", 1) + 1
+        events.record(game, "next_round")
+        broadcaster.emit("round_ready", {
+            "round_number": game.current_round,
+        }, room=game_id)
+    else:
+        # Game completely finished
+        scores = {t: game.teams[t].score for t in game.teams}
+        scores = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        # for debugging only
+        if len(scores) == 1:
+            scores.append(["Testing Team", 12])
+        broadcaster.emit("game_over", {
+                    "redirect_url": f"/game_over/{game_id}/{scores[0][0]}/{scores[0][1]}/{scores[1][0]}/{scores[1][1]}"
+                }, room=game_id)
 
 @socketio.on("pause_round")
+@metrics.instrumented("pause_round")
+@per_game
 def pause_round(data):
-    game = active_games[data["game_id"]]
-    game.paused = True
-    socketio.emit("update_pause", room=data["game_id"])
+    game_id = data["game_id"]
+    game = active_games[game_id]
+    if game.paused or game.turn_ends_at is None:
+        return
+    stop_turn_clock(game_id)
+    game.pause_clock(time.time(), TIMER_LENGTH)
+    events.record(game, "pause")
+    active_games.save(game)
+    broadcaster.emit("update_pause", {
+        "paused": True,
+        "time_left": game.turn_time_left
+    }, room=game_id)
 
 @socketio.on("resume_round")
+@metrics.instrumented("resume_round")
+@per_game
 def resume_round(data):
-    game = active_games[data["game_id"]]
-    game.paused = False
-    socketio.emit("update_pause", room=data["game_id"])
+    game_id = data["game_id"]
+    game = active_games[game_id]
+    if not game.paused:
+        return
+    now = time.time()
+    ends_at = game.start_clock(now, TIMER_LENGTH)
+    events.record(game, "start_clock")
+    active_games.save(game)
+    schedule_turn_clock(game_id, game, compat_ticks=current_app.config["TIMER_TICK_COMPAT"])
+    broadcaster.emit("update_pause", {
+        "paused": False,
+        "time_left": game.turn_time_left,
+        "ends_at": ends_at,
+        "server_time": now
+    }, room=game_id)
 
 @socketio.on("lobby_return")
+@metrics.instrumented("lobby_return")
+@per_game
 def lobby_return(data):
     '''Returns user to lobby and deletes active game if the last user in the game'''
     game_id = data["game_id"]
-    k1 = list(active_games[game_id].players.keys())[0]
-    del_player = active_games[game_id].players.pop(k1)
+    game = active_games.get(game_id)
+    # the leaving player is whoever this session joined as
+    k1 = presence.session(request.sid)[1] or data.get("player_name")
+    if game is None or k1 not in game.players:
+        emit("redirect_to_lobby", {"url": url_for("routes.lobby")})
+        return
+    del_player = game.remove_player(k1)
     del del_player
-    print(active_games[game_id].players)
-    if not active_games[game_id].players:  # no players left
+    events.record(game, "leave", player=k1)
+    for_game(game, __name__).info("player %s left, %d remaining", k1, len(game.players))
+    if not game.players:  # no players left
         # remove from list of active games
+        drop_game(game_id)
         curr_game = active_games.pop(game_id, None)
         del curr_game
-        print(active_games)
+        logger.info("game %s removed", game_id)
+    else:
+        active_games.save(game)
 
     emit("redirect_to_lobby", {
         "url": url_for("routes.lobby")
@@ -397,6 +710,7 @@ def game_over(game_id, team_1, score_1, team_2, score_2):
     return render_template(
         "game_over.html",
         game_id=game_id,
+        player_name=request.args.get("player_name", ""),
         team_1=team_1,
         score_1=score_1,
         team_2=team_2,
@@ -0,0 +1,127 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+class ScheduledCall:
+    '''Handle for a call registered with TurnScheduler.call_at. Cancelling is O(1)'''
+    __slots__ = ("when", "order", "fn", "args", "cancelled")
+
+    def __init__(self, when, order, fn, args):
+        self.when = when
+        self.order = order
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.order) < (other.when, other.order)
+
+    def cancel(self):
+        # left in the heap and skipped when it comes up
+        self.cancelled = True
+
+class TurnScheduler:
+    '''
+    Single background task that fires turn deadlines for every game.
+
+    Deadlines sit in a heap ordered by wall-clock time. The task sleeps until the
+    earliest one is due (or until an earlier one is added), so idle or paused games
+    cost nothing instead of each keeping its own timer loop awake. Under the asyncio
+    server (flaskr/asgi.py) the task is a coroutine on the server's event loop that
+    hands due calls to a thread pool, since they take game locks and touch the store.
+    '''
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self._socketio = None
+        self._wakeup = None
+        self._task = None
+        self._loop = None
+        self._executor = None
+
+    def init_app(self, app, socketio):
+        self._socketio = socketio
+
+    def use_loop(self, loop, executor=None):
+        '''
+        Runs the task as a coroutine on an asyncio event loop instead of a background
+        task. Due calls run on executor (the loop's default one if None)
+        '''
+        self._loop = loop
+        self._executor = executor
+
+    def call_at(self, when, fn, *args) -> ScheduledCall:
+        '''Runs fn(*args) on the scheduler task once time.time() reaches when'''
+        with self._lock:
+            call = ScheduledCall(when, next(self._order), fn, args)
+            heapq.heappush(self._heap, call)
+            self._ensure_running()
+            earliest = self._heap[0] is call
+        if earliest:
+            # new earliest deadline, the task may be sleeping past it
+            if self._loop is None:
+                self._wakeup.set()
+            else:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+        return call
+
+    def _ensure_running(self):
+        if self._task is None:
+            if self._loop is not None:
+                self._wakeup = asyncio.Event()
+                self._task = asyncio.run_coroutine_threadsafe(self._run_async(), self._loop)
+            else:
+                self._wakeup = self._socketio.server.eio.create_event()
+                self._task = self._socketio.start_background_task(self._run)
+
+    def _fire_due(self):
+        '''Runs every call that is due. Returns (whether any ran, seconds until the next one)'''
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._heap and (self._heap[0].cancelled or self._heap[0].when <= now):
+                call = heapq.heappop(self._heap)
+                if not call.cancelled:
+                    due.append(call)
+            timeout = self._heap[0].when - now if self._heap else None
+
+        for call in due:
+            if self._loop is not None:
+                self._loop.run_in_executor(self._executor, self._call, call)
+            else:
+                self._call(call)
+        return bool(due), timeout
+
+    @staticmethod
+    def _call(call):
+        if call.cancelled:
+            return  # cancelled by an earlier callback in this batch
+        try:
+            call.fn(*call.args)
+        except Exception:
+            logging.exception("scheduled call %r failed", call.fn)
+
+    def _run(self):
+        while True:
+            fired, timeout = self._fire_due()
+            if fired:
+                continue  # callbacks may have scheduled more, recompute the timeout
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    async def _run_async(self):
+        while True:
+            fired, timeout = self._fire_due()
+            if fired:
+                continue  # recompute the timeout, the calls were only handed off
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+turn_scheduler = TurnScheduler()
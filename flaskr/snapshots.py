@@ -0,0 +1,162 @@
+import atexit
+import contextlib
+import json
+import logging
+import os
+import time
+
+from .catalog import Catalog, find_catalog, remember_catalog
+from .models import Game
+from .store import MemoryBackend, encode_game
+
+logger = logging.getLogger(__name__)
+
+class GameSnapshots:
+    '''
+    Keeps in-memory games across restarts and crashes. Every SNAPSHOT_INTERVAL seconds
+    (and once more at shutdown) the games changed since the last pass are appended to
+    SNAPSHOT_FILE, one compact JSON line each, behind a marker line with the pass time
+    and the ids still live. Each pass is one write and one fsync. On startup the latest
+    record of every live game is loaded back with its turn clock paused, so the room can
+    reconnect and resume. Games in Redis already survive restarts, so this only runs for
+    the in-memory store.
+
+    Records hold catalog cards as ids, so every catalog a live game uses is also copied
+    to SNAPSHOT_FILE + ".cards", once per catalog. Games then restore with the cards
+    they had even if cards.json changed in between.
+    '''
+    def __init__(self):
+        self.store = None
+        self.path = None
+        self.lock_for = None
+        self.last_pass = 0
+        self.records = 0  # game lines in the file, to know when it's worth compacting
+        self.saved_catalogs = set()  # fingerprints already in the .cards file
+        self._at_exit = False
+
+    def init_app(self, app, socketio, store, lock_for=None, tick_length=1):
+        self.path = app.config["SNAPSHOT_FILE"]
+        if not self.path or not isinstance(store.backend, MemoryBackend):
+            self.path = None
+            return
+        self.store = store
+        self.lock_for = lock_for
+        restored = self.restore(tick_length)
+        logger.info("restored %d games from %s", restored, self.path)
+        if not self._at_exit:
+            atexit.register(self.snapshot)
+            self._at_exit = True
+        if app.config["SNAPSHOT_INTERVAL"]:
+            socketio.start_background_task(self._run, socketio, app.config["SNAPSHOT_INTERVAL"])
+
+    def _run(self, socketio, interval):
+        while True:
+            socketio.sleep(interval)
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("snapshotting games failed")
+
+    def _lock(self, game_id):
+        return self.lock_for(game_id) if self.lock_for else contextlib.nullcontext()
+
+    def snapshot(self, full=False) -> int:
+        '''Appends every game changed since the last pass (every game if full). Returns how many'''
+        if self.path is None:
+            return 0
+        # the first pass starts the file over, dropping old versions and finished games
+        full = full or not self.last_pass
+        now = time.time()
+        live = self.store.ids()
+        lines = [json.dumps({"at": now, "live": live}, separators=(",", ":")).encode("utf-8")]
+        catalogs = {}
+        for game_id in live:
+            with self._lock(game_id):
+                game = self.store.get(game_id)
+                if game is None:
+                    continue
+                catalogs[game.catalog.fingerprint] = game.catalog
+                if full or game.last_activity >= self.last_pass:
+                    lines.append(encode_game(game))
+        if not catalogs.keys() <= self.saved_catalogs:
+            self._save_catalogs(catalogs)
+
+        # rewrite instead of appending once old versions outnumber the live games
+        rewrite = full or self.records > 4 * max(len(live), 16)
+        path = self.path + ".tmp" if rewrite else self.path
+        with open(path, "wb" if rewrite else "ab") as f:
+            f.write(b"\n".join(lines) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if rewrite:
+            os.replace(path, self.path)
+            self.records = 0
+        self.records += len(lines) - 1
+        self.last_pass = now
+        return len(lines) - 1
+
+    def _save_catalogs(self, catalogs):
+        '''Rewrites the .cards file with the catalogs live games use, before any record needs them'''
+        path = self.path + ".cards"
+        with open(path + ".tmp", "wb") as f:
+            for fingerprint, catalog in catalogs.items():
+                f.write(json.dumps({"fingerprint": fingerprint, "cards": catalog.rows()},
+                                   separators=(",", ":")).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.saved_catalogs = set(catalogs)
+
+    def _load_catalogs(self):
+        try:
+            with open(self.path + ".cards", "rb") as f:
+                for line in f:
+                    record = json.loads(line)
+                    remember_catalog(Catalog.from_rows(record["cards"], record["fingerprint"]))
+                    self.saved_catalogs.add(record["fingerprint"])
+        except (OSError, ValueError) as e:
+            logger.warning("could not read saved catalogs: %s", e)
+
+    def restore(self, tick_length=1) -> int:
+        '''Loads the games that were live at the last pass. Returns how many'''
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+
+        latest = {}  # game id -> newest state
+        live, at = (), 0
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crash mid-pass, an older version is still there
+            if "live" in record:
+                live, at = record["live"], record["at"]
+            else:
+                latest[record["id"]] = record
+
+        restored = 0
+        loaded_catalogs = False
+        for game_id in live:
+            if game_id not in latest or game_id in self.store:
+                continue
+            state = latest[game_id]
+            if not loaded_catalogs and "catalog" in state and find_catalog(state["catalog"]) is None:
+                # cards.json changed since the game was saved, use the copy kept next to the file
+                self._load_catalogs()
+                loaded_catalogs = True
+            try:
+                game = Game.from_state(state)
+            except (LookupError, TypeError, ValueError) as e:
+                logger.warning("skipped restoring game %s: %r", game_id, e)
+                continue
+            if game.turn_ends_at is not None:
+                # the last pass is the last time the process was known to be up, freeze the clock there
+                game.pause_clock(at, tick_length)
+            self.store.backend.put(game)
+            restored += 1
+        return restored
+
+game_snapshots = GameSnapshots()
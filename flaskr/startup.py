@@ -0,0 +1,103 @@
+'''
+Startup profiling: how long each import takes, how long create_app() takes and how
+long until the first request is answered. Install the import hook before anything
+from flaskr or flask is imported (run.py does this for --profile-startup and
+SHMONIKERS_PROFILE_STARTUP), so stdlib-only imports are all this module uses.
+'''
+import importlib.abc
+import sys
+import time
+
+class _TimedLoader(importlib.abc.Loader):
+    '''Wraps a module's real loader and times its execution'''
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        profiler = self.profiler
+        profiler._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            nested = profiler._stack.pop()
+            if profiler._stack:
+                profiler._stack[-1] += total
+            profiler.imports[module.__name__] = (total - nested, total)
+
+    def __getattr__(self, name):
+        # get_data, is_package, ... for importlib.resources and friends
+        return getattr(self.loader, name)
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    '''Meta path hook recording self and cumulative import time per module'''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = {}  # module name -> (self seconds, cumulative seconds)
+        self.phases = {}   # name -> seconds since the profiler started
+        self._stack = []
+        self._finding = False
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        if self._finding:
+            return None
+        self._finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def mark(self, phase):
+        '''Records that a phase (e.g. "create_app") finished now'''
+        self.phases[phase] = time.perf_counter() - self.started
+
+    def report(self, top=15) -> dict:
+        by_package = {}
+        for name, (own, _) in self.imports.items():
+            package = name.split(".")[0]
+            by_package[package] = by_package.get(package, 0) + own
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            "phases": self.phases,
+            "import_seconds": sum(own for own, _ in self.imports.values()),
+            "modules_imported": len(self.imports),
+            "by_package": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]),
+            "slowest_modules": {name: {"self": own, "cumulative": total} for name, (own, total) in slowest},
+        }
+
+def format_report(report) -> str:
+    lines = ["startup profile"]
+    for phase, seconds in report["phases"].items():
+        lines.append(f"  {phase:<28}{seconds * 1000:>10.1f} ms")
+    lines.append(f"  {'imports (' + str(report['modules_imported']) + ' modules)':<28}"
+                 f"{report['import_seconds'] * 1000:>10.1f} ms")
+    lines.append("import time by package (self)")
+    for package, seconds in report["by_package"].items():
+        lines.append(f"  {package:<28}{seconds * 1000:>10.1f} ms")
+    lines.append("slowest modules (cumulative / self)")
+    for name, row in report["slowest_modules"].items():
+        lines.append(f"  {name:<40}{row['cumulative'] * 1000:>10.1f} ms{row['self'] * 1000:>10.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,154 @@
+import json
+import time
+
+from .catalog import Catalog, find_catalog, remember_catalog
+from .models import Game
+
+def encode_game(game: Game) -> bytes:
+    return json.dumps(game.to_state(), separators=(",", ":")).encode("utf-8")
+
+def decode_game(data: bytes) -> Game:
+    return Game.from_state(json.loads(data))
+
+class MemoryBackend:
+    '''Keeps live Game objects in a dict. Fastest, but one process only and lost on restart'''
+    def __init__(self):
+        self._games = {}
+
+    def get(self, game_id):
+        return self._games.get(game_id)
+
+    def put(self, game):
+        self._games[game.session_id] = game
+
+    def save(self, game):
+        pass  # handlers mutate the stored object directly
+
+    def exists(self, game_id):
+        return game_id in self._games
+
+    def delete(self, game_id):
+        return self._games.pop(game_id, None)
+
+    def ids(self):
+        return list(self._games)
+
+class RedisBackend:
+    '''
+    Stores games serialized in Redis (or anything speaking its protocol, e.g. fakeredis),
+    so several workers can share them and they survive restarts. Every get() returns a
+    fresh copy, so handlers must save() after changing a game. Writes are last-writer-wins,
+    so route each game's traffic to one worker (sticky sessions) when running several.
+    Each catalog a game is saved with is stored too, so games still decode with the
+    cards they had after cards.json changes or on a worker that never loaded it. A
+    catalog expires catalog_ttl seconds (0 never) after the last save of a game using it.
+    '''
+    def __init__(self, url=None, client=None, prefix="shmonikers:", catalog_ttl=0):
+        if client is None:
+            import redis  # only needed for this backend
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.catalog_ttl = catalog_ttl
+        self._stored_catalogs = {}  # fingerprint -> when this process last stored or refreshed it
+
+    def _key(self, game_id):
+        return f"{self.prefix}game:{game_id}"
+
+    def _catalog_key(self, fingerprint):
+        return f"{self.prefix}catalog:{fingerprint}"
+
+    def _decode(self, data):
+        state = json.loads(data)
+        fingerprint = state.get("catalog")
+        if fingerprint and find_catalog(fingerprint) is None:
+            rows = self.client.get(self._catalog_key(fingerprint))
+            if rows is not None:
+                remember_catalog(Catalog.from_rows(json.loads(rows), fingerprint))
+        return Game.from_state(state)
+
+    def _keep_catalog(self, catalog):
+        '''Stores catalog, or pushes back its expiry, at most every catalog_ttl / 2 seconds'''
+        now = time.time()
+        refreshed = self._stored_catalogs.get(catalog.fingerprint)
+        if refreshed is not None and (not self.catalog_ttl or now - refreshed < self.catalog_ttl / 2):
+            return
+        key = self._catalog_key(catalog.fingerprint)
+        if not self.catalog_ttl or not self.client.expire(key, self.catalog_ttl):
+            self.client.set(key, json.dumps(catalog.rows(), separators=(",", ":")),
+                            nx=True, ex=self.catalog_ttl or None)
+        self._stored_catalogs[catalog.fingerprint] = now
+
+    def get(self, game_id):
+        data = self.client.get(self._key(game_id))
+        return self._decode(data) if data is not None else None
+
+    def put(self, game):
+        self._keep_catalog(game.catalog)
+        self.client.set(self._key(game.session_id), encode_game(game))
+
+    save = put
+
+    def exists(self, game_id):
+        return bool(self.client.exists(self._key(game_id)))
+
+    def delete(self, game_id):
+        key = self._key(game_id)
+        data = self.client.get(key)
+        self.client.delete(key)
+        return self._decode(data) if data is not None else None
+
+    def ids(self):
+        start = len(self._key(""))
+        return [key.decode("utf-8")[start:] for key in self.client.scan_iter(match=self._key("*"))]
+
+class GameStore:
+    '''
+    Where active games live. Behaves like the dict it replaces; the backend is picked
+    from GAME_STORE_URL in init_app ("memory", the default, or a redis:// URL).
+    '''
+    def __init__(self):
+        self.backend = MemoryBackend()
+
+    def init_app(self, app):
+        url = app.config.get("GAME_STORE_URL") or "memory"
+        if url == "memory":
+            self.backend = MemoryBackend()
+        elif url.startswith(("redis://", "rediss://", "unix://")):
+            # twice the idle TTL: a catalog outlives every game the reaper hasn't evicted
+            self.backend = RedisBackend(url, catalog_ttl=2 * app.config.get("GAME_IDLE_TTL", 0))
+        else:
+            raise ValueError(f"Unsupported GAME_STORE_URL: {url}")
+
+    def get(self, game_id, default=None):
+        if game_id is None:
+            return default
+        game = self.backend.get(game_id)
+        return game if game is not None else default
+
+    def __getitem__(self, game_id):
+        game = self.backend.get(game_id)
+        if game is None:
+            raise KeyError(game_id)
+        return game
+
+    def __setitem__(self, game_id, game):
+        game.touch()
+        self.backend.put(game)
+
+    def __contains__(self, game_id):
+        return self.backend.exists(game_id)
+
+    def save(self, game):
+        '''Writes back a changed game (a no-op for the in-memory backend) and marks it active'''
+        game.touch()
+        self.backend.save(game)
+
+    def pop(self, game_id, default=None):
+        game = self.backend.delete(game_id)
+        return game if game is not None else default
+
+    def ids(self):
+        return self.backend.ids()
+
+active_games = GameStore()
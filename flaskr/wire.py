@@ -0,0 +1,42 @@
+'''
+Optional compact wire encoding. A client that connects with auth={"wire": "msgpack"}
+gets room events as one binary "packed" event holding msgpack-encoded [[event, data], ...]
+pairs, with cards in state snapshots sent as ids it already got from the page's first snapshot.
+Everyone else, and every client when msgpack isn't installed, keeps plain JSON events.
+'''
+try:
+    import msgpack  # optional, only needed for the compact encoding
+except ImportError:
+    msgpack = None
+
+# sids that negotiated the compact encoding on connect
+compact_sids = set()
+
+def negotiate(sid, auth):
+    '''Records a new connection's encoding. Returns the one it will get'''
+    if msgpack is not None and isinstance(auth, dict) and auth.get("wire") == "msgpack":
+        compact_sids.add(sid)
+        return "msgpack"
+    return "json"
+
+def forget(sid):
+    compact_sids.discard(sid)
+
+def is_compact(sid) -> bool:
+    return sid in compact_sids
+
+def room_for(game_id, sid):
+    '''Compact clients sit in their own room next to the game's, so each room gets one encoding'''
+    return packed_room(game_id) if sid in compact_sids else game_id
+
+def packed_room(room):
+    return f"{room}#msgpack"
+
+def compact(event, data):
+    '''Swaps full card dicts for card ids; the client resolves them against its own copy'''
+    if event == "update_game_state" and data:
+        data = dict(data, game_pool=[card["id"] for card in data["game_pool"]])
+    return data
+
+def pack(events) -> bytes:
+    return msgpack.packb([[event, compact(event, data)] for event, data in events])
@@ -1,6 +1,43 @@
+import json
+import logging
+import os
+import sys
+
+# --profile-startup prints where startup time goes and exits; SHMONIKERS_PROFILE_STARTUP=1
+# logs the same report and keeps serving. Either way the hook must go in before flask loads
+PROFILE_ONLY = "--profile-startup" in sys.argv
+profiler = None
+if PROFILE_ONLY or os.environ.get("SHMONIKERS_PROFILE_STARTUP"):
+    from flaskr.startup import StartupProfiler, format_report
+    profiler = StartupProfiler().install()
+
 from flaskr import create_app, socketio
 
-app = create_app()
+if profiler:
+    profiler.mark("import flaskr")
+
+# debug=True below runs this file twice: a reloader that only watches for changes, and the
+# server it starts (with WERKZEUG_RUN_MAIN set). Only the server may restore and write snapshots
+RELOADER = __name__ == "__main__" and not PROFILE_ONLY and not os.environ.get("WERKZEUG_RUN_MAIN")
+if PROFILE_ONLY:
+    # a profiling run next to a live server must not restore, rewrite or append to its files
+    config = {"SNAPSHOT_FILE": None, "EVENT_LOG_FILE": None, "CUSTOM_CARDS_FILE": None}
+elif RELOADER:
+    config = {"SNAPSHOT_FILE": None}
+else:
+    config = None
+app = create_app(config)
+
+if profiler:
+    profiler.mark("create_app")
+    app.test_client().get("/")
+    profiler.mark("first request")
+    profiler.uninstall()
+    report = profiler.report()
+    if PROFILE_ONLY:
+        print(json.dumps(report, indent=2) if "--json" in sys.argv else format_report(report))
+        sys.exit(0)
+    logging.getLogger("flaskr.startup").info("startup profile %s", json.dumps(report, separators=(",", ":")))
 
 if __name__ == "__main__":
-    socketio.run(app, debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    socketio.run(app, debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,120 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from flaskr import catalog
+from flaskr.models import Game, Player
+from flaskr.store import RedisBackend
+
+def write_cards(path, cards):
+    path.write_text(json.dumps(cards), encoding="utf-8")
+
+def make_cards(n):
+    return [{"term": f"term {i}", "definition": f"definition {i}", "points": i % 3 + 1,
+             "category": "abc"[i % 3]} for i in range(n)]
+
+def reload_catalog(monkeypatch):
+    '''Forgets every loaded catalog, as a freshly started worker would'''
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(catalog, "_known", OrderedDict())
+
+@pytest.fixture
+def cards_file(tmp_path, monkeypatch):
+    path = tmp_path / "cards.json"
+    write_cards(path, make_cards(200))
+    monkeypatch.setattr(catalog, "CARDS_FILE", path)
+    monkeypatch.setattr(catalog, "CUSTOM_CARDS_FILE", None)
+    reload_catalog(monkeypatch)
+    return path
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+def backend_on(server):
+    return RedisBackend(client=fakeredis.FakeRedis(server=server))
+
+def game_in_progress():
+    game = Game("g1", seed=7)
+    players = [Player(name, team) for name, team in (("ann", "Red"), ("bob", "Blue"), ("cat", "Red"))]
+    for player in players:
+        game.add_player(player)
+    game.deal(players)
+    for player in players:
+        game.submit_cards(player, player.hand[:6])
+    game.submit_cards(players[0], [game.new_custom_card("Custom", "Written in the game", 2)])
+    game.start_round()
+    game.begin_turn()
+    game.start_clock(1000.0)
+    game.guess_card(game.active_pool.first().id, "Red")
+    game.skip_card(game.active_pool.first().id)
+    return game
+
+def terms(game):
+    return {name: [card.term for card in player.hand + player.submitted] for name, player in game.players.items()}
+
+def test_round_trip(cards_file, server):
+    game = game_in_progress()
+    backend = backend_on(server)
+    backend.put(game)
+
+    copy = backend.get("g1")
+    assert copy is not game
+    assert copy.to_state() == game.to_state()
+    assert copy.catalog is game.catalog
+    assert terms(copy) == terms(game)
+    assert copy.active_pool.to_list() == game.active_pool.to_list()
+    assert copy.teams["Red"].score == game.teams["Red"].score
+    assert backend.ids() == ["g1"]
+
+def test_round_trip_after_catalog_change(cards_file, server, monkeypatch):
+    game = game_in_progress()
+    backend_on(server).put(game)
+
+    # a redeploy with a reordered, shorter cards.json, on a worker that never saw the old one
+    write_cards(cards_file, make_cards(200)[::-1][:50])
+    reload_catalog(monkeypatch)
+    copy = backend_on(server).get("g1")
+
+    assert terms(copy) == terms(game)
+    assert copy.to_state() == game.to_state()
+    assert len(catalog.get_catalog()) == 50
+    assert copy.catalog.fingerprint != catalog.get_catalog().fingerprint
+
+def test_missing_catalog_is_an_error(cards_file, server, monkeypatch):
+    game = game_in_progress()
+    backend = backend_on(server)
+    backend.put(game)
+    backend.client.delete(backend._catalog_key(game.catalog.fingerprint))
+
+    write_cards(cards_file, make_cards(50))
+    reload_catalog(monkeypatch)
+    with pytest.raises(LookupError):
+        backend_on(server).get("g1")
+
+def test_catalog_expires_after_its_games(cards_file, server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("flaskr.store.time.time", lambda: now[0])
+    game = game_in_progress()
+    backend = RedisBackend(client=fakeredis.FakeRedis(server=server), catalog_ttl=100)
+    key = backend._catalog_key(game.catalog.fingerprint)
+    backend.put(game)
+    assert 0 < backend.client.ttl(key) <= 100
+
+    # refreshed on a save once half the TTL has passed, not on every save
+    backend.client.expire(key, 40)
+    now[0] += 10
+    backend.put(game)
+    assert backend.client.ttl(key) <= 40
+    now[0] += 50
+    backend.put(game)
+    assert backend.client.ttl(key) > 40
+
+    # stored again if it expired while this process thought it was there
+    backend.client.delete(key)
+    now[0] += 50
+    backend.put(game)
+    assert backend.client.exists(key)